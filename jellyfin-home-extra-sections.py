@@ -11,18 +11,24 @@ Qué hace:
 
 Requisitos:
   pip install requests pyyaml
+  (opcional) pip install brotli   -> respuestas con Content-Encoding: br además de gzip
 """
 
 from __future__ import annotations
 
 import argparse
+import gzip
+import hashlib
 import json
 import logging
 import os
 import random
 import sys
+import threading
 import time
 import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from datetime import datetime
 from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
@@ -37,6 +43,11 @@ try:
 except Exception:
     yaml = None  # type: ignore
 
+try:
+    import brotli  # type: ignore
+except Exception:
+    brotli = None  # type: ignore
+
 
 # -------------------------
 # Logging
@@ -214,45 +225,351 @@ def compact_item(it: Dict[str, Any]) -> Dict[str, Any]:
 class CacheEntry:
     expires_at: float
     payload: Dict[str, Any]
+    body: bytes = b""  # payload ya serializado (JSON), para no repetir json.dumps en cada petición
+    etag: str = ""
+
+
+def encode_payload(payload: Dict[str, Any]) -> Tuple[bytes, str]:
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return body, hashlib.sha1(body).hexdigest()[:20]
+
+
+def make_entry(payload: Dict[str, Any], ttl: int = 0) -> CacheEntry:
+    body, etag = encode_payload(payload)
+    return CacheEntry(expires_at=time.time() + max(1, ttl), payload=payload, body=body, etag=etag)
+
+
+class PoolItem:
+    """Lo mínimo de un item para muestrearlo en local; un pool de 5000 ocupa del orden de 1 MB."""
+
+    __slots__ = ("id", "name", "type", "year", "rating", "image_tag")
+
+    def __init__(self, it: Dict[str, Any]) -> None:
+        c = compact_item(it)
+        self.id = c["id"]
+        self.name = c["name"]
+        self.type = c["type"]
+        self.year = c["year"]
+        rating = c["communityRating"]
+        self.rating = float(rating) if isinstance(rating, (int, float)) else None
+        self.image_tag = c["primaryImageTag"]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "type": self.type,
+            "year": self.year,
+            "communityRating": self.rating,
+            "primaryImageTag": self.image_tag,
+        }
+
+
+@dataclass
+class ItemPool:
+    loaded_at: float
+    items: Tuple[PoolItem, ...]
+
+
+PoolKey = Tuple[str, str, str]  # (kind, scope, tipos)
+
+
+class ItemPoolStore:
+    """
+    Pools de items en memoria por biblioteca / género / colección, para muestrear "random" sin pedirle a
+    Jellyfin un sortBy=Random en cada petición.
+
+    La primera petición de un pool lo carga (una sola vez aunque lleguen varias a la vez); después, pasado
+    refresh_seconds, se sigue usando el pool viejo mientras se recarga en segundo plano. Con force (refresh=1)
+    se recarga en el momento, pero solo si tiene más de min_reload_seconds: un refresh no vacía los pools de todos.
+    """
+
+    def __init__(self, refresh_seconds: int, max_items: int, executor: ThreadPoolExecutor,
+                 min_reload_seconds: int = 300) -> None:
+        self.refresh_seconds = max(1, refresh_seconds)
+        self.min_reload_seconds = max(0, min_reload_seconds)
+        self.max_items = max(1, max_items)
+        self.executor = executor
+        self.pools: Dict[PoolKey, ItemPool] = {}
+        self.lock = threading.Lock()
+        self.key_locks: Dict[PoolKey, threading.Lock] = {}
+        self.refreshing: set = set()
+
+    def _load(self, key: PoolKey, loader) -> ItemPool:
+        t0 = time.time()
+        pool = ItemPool(loaded_at=time.time(), items=tuple(PoolItem(it) for it in loader()))
+        with self.lock:
+            self.pools[key] = pool
+        logging.debug("Pool %s cargado: %d items en %.2fs", key, len(pool.items), time.time() - t0)
+        return pool
+
+    def get(self, key: PoolKey, loader, force: bool = False) -> Tuple[PoolItem, ...]:
+        def stale(p: Optional[ItemPool]) -> bool:
+            return p is None or (force and time.time() - p.loaded_at >= self.min_reload_seconds)
+
+        with self.lock:
+            pool = self.pools.get(key)
+            key_lock = self.key_locks.setdefault(key, threading.Lock())
+        if stale(pool):
+            with key_lock:
+                with self.lock:
+                    pool = self.pools.get(key)
+                if stale(pool):
+                    pool = self._load(key, loader)
+            return pool.items
+
+        if time.time() - pool.loaded_at >= self.refresh_seconds:
+            with self.lock:
+                start = key not in self.refreshing
+                self.refreshing.add(key)
+            if start:
+                self.executor.submit(self._refresh, key, loader)
+        return pool.items
+
+    def _refresh(self, key: PoolKey, loader) -> None:
+        try:
+            self._load(key, loader)
+        except Exception as e:
+            logging.warning("Recarga del pool %s falló (se sigue usando el anterior): %r", key, e)
+        finally:
+            with self.lock:
+                self.refreshing.discard(key)
+
+
+class LookupCache:
+    """
+    Resoluciones nombre->id (bibliotecas por usuario, BoxSets por nombre) con un TTL largo.
+
+    Un resultado vacío (no encontrado) se guarda con negative_ttl, más corto, para que una colección recién
+    creada aparezca pronto sin repetir la búsqueda en cada build.
+    """
+
+    def __init__(self, ttl_seconds: int = 21600, negative_ttl_seconds: int = 300) -> None:
+        self.ttl = max(1, ttl_seconds)
+        self.negative_ttl = max(0, negative_ttl_seconds)
+        self.entries: Dict[Tuple[str, str], Tuple[float, Any, float]] = {}  # key -> (expires_at, value, loaded_at)
+        self.lock = threading.Lock()
+
+    def get(self, key: Tuple[str, str], loader, max_age: Optional[float] = None) -> Any:
+        """max_age: además del TTL, vuelve a resolver si el valor tiene más de max_age segundos (refresh=1)."""
+        now = time.time()
+        with self.lock:
+            ent = self.entries.get(key)
+        if ent is not None and now < ent[0] and (max_age is None or now - ent[2] < max_age):
+            return ent[1]
+        value = loader()
+        with self.lock:
+            self.entries[key] = (now + (self.ttl if value else self.negative_ttl), value, now)
+        return value
+
+    def invalidate(self, kind: Optional[str] = None, name: Optional[str] = None) -> None:
+        with self.lock:
+            for key in list(self.entries):
+                if (kind is None or key[0] == kind) and (name is None or key[1] == name):
+                    del self.entries[key]
+
+
+CacheKey = Tuple[str, str, str]  # (section id, userId, hash de la config de la sección)
+
+
+class SectionCache:
+    """
+    LRU de secciones ya generadas, con stale-while-revalidate.
+
+    Una entrada caducada se sigue sirviendo tal cual (hasta max_stale_seconds) mientras un worker en segundo
+    plano la regenera; así una petición nunca espera a Jellyfin salvo la primera vez (o tras max_stale).
+    """
+
+    def __init__(self, max_entries: int = 256, refresh_workers: int = 2, max_stale_seconds: int = 86400) -> None:
+        self.max_entries = max(1, max_entries)
+        self.max_stale_seconds = max(0, max_stale_seconds)
+        self.entries: "OrderedDict[CacheKey, CacheEntry]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.refreshing: set = set()
+        self.pool = ThreadPoolExecutor(max_workers=max(1, refresh_workers), thread_name_prefix="section-refresh")
+
+    def lookup(self, key: CacheKey) -> Tuple[Optional[CacheEntry], bool]:
+        """(entry, fresh). entry None = no hay nada servible."""
+        now = time.time()
+        with self.lock:
+            ent = self.entries.get(key)
+            if ent is None:
+                return None, False
+            if now >= ent.expires_at + self.max_stale_seconds:
+                del self.entries[key]
+                return None, False
+            self.entries.move_to_end(key)
+            return ent, now < ent.expires_at
+
+    def store(self, key: CacheKey, ttl: int, payload: Dict[str, Any]) -> CacheEntry:
+        ent = make_entry(payload, ttl)
+        with self.lock:
+            self.entries[key] = ent
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return ent
+
+    def revalidate(self, key: CacheKey, build) -> None:
+        """Lanza build() en segundo plano (una sola vez por clave); si falla se queda la entrada stale."""
+        with self.lock:
+            if key in self.refreshing:
+                return
+            self.refreshing.add(key)
+
+        def _run() -> None:
+            try:
+                build()
+            except Exception as e:
+                logging.warning("Refresco en segundo plano de %s (user %s) falló: %r", key[0], key[1], e)
+            finally:
+                with self.lock:
+                    self.refreshing.discard(key)
+
+        self.pool.submit(_run)
+
+
+def section_cache_key(section: Dict[str, Any], user_id: str) -> CacheKey:
+    params = json.dumps(section, sort_keys=True, ensure_ascii=False, default=str)
+    return (str(section.get("id") or ""), user_id, hashlib.sha1(params.encode("utf-8")).hexdigest()[:16])
 
 
 class SectionEngine:
     def __init__(self, jf: JellyfinClient, cfg: Dict[str, Any]) -> None:
         self.jf = jf
         self.cfg = cfg
-        self.cache: Dict[str, CacheEntry] = {}
+        c = cfg.get("cache") or {}
+        self.cache = SectionCache(
+            max_entries=int(c.get("max_entries") or 256),
+            refresh_workers=int(c.get("refresh_workers") or 2),
+            max_stale_seconds=int(c.get("max_stale_seconds") if c.get("max_stale_seconds") is not None else 86400),
+        )
+        self.failed_since: Dict[CacheKey, str] = {}  # sección que está fallando -> generatedAt del primer fallo
         self.rng = random.Random()
+        self.rng_lock = threading.Lock()
+
+        # Secciones y consultas a Jellyfin en paralelo. Dos pools separados: una sección que espera a sus
+        # consultas por biblioteca nunca ocupa el hueco que esas consultas necesitan.
+        s = cfg.get("server") or {}
+        self.section_pool = ThreadPoolExecutor(max_workers=max(1, int(s.get("parallel_sections") or 8)),
+                                               thread_name_prefix="section")
+        self.fetch_pool = ThreadPoolExecutor(max_workers=max(1, int(s.get("parallel_requests") or 6)),
+                                             thread_name_prefix="jf-fetch")
+
+        lk = cfg.get("lookups") or {}
+        self.lookups = LookupCache(
+            ttl_seconds=int(lk.get("ttl_seconds") or 21600),
+            negative_ttl_seconds=int(lk.get("negative_ttl_seconds") if lk.get("negative_ttl_seconds") is not None else 300),
+        )
 
-    def _cached(self, key: str) -> Optional[Dict[str, Any]]:
-        ent = self.cache.get(key)
-        if not ent:
-            return None
-        if time.time() >= ent.expires_at:
-            self.cache.pop(key, None)
-            return None
-        return ent.payload
+        p = cfg.get("pools") or {}
+        self.pools = ItemPoolStore(
+            refresh_seconds=int(p.get("refresh_seconds") or 1800),
+            max_items=int(p.get("max_items") or 5000),
+            executor=self.fetch_pool,
+            min_reload_seconds=int(p.get("min_reload_seconds") if p.get("min_reload_seconds") is not None else 300),
+        )
+
+    def _sample(self, items, k: int) -> List[Any]:
+        with self.rng_lock:
+            return self.rng.sample(items, min(max(0, k), len(items)))
+
+    def _pool(self, kind: str, scope: str, include_types: List[str], force: bool = False) -> Tuple["PoolItem", ...]:
+        """Pool local de items para kind=all|library|collection|genre (scope = parentId / género)."""
+        key: PoolKey = (kind, scope, join_csv(sorted(include_types)))
+
+        def load() -> List[Dict[str, Any]]:
+            params = {
+                "parentId": scope if kind in ("library", "collection") else None,
+                "genres": join_pipe([scope]) if kind == "genre" else None,  # Jellyfin espera pipe-delimited
+                "includeItemTypes": join_csv(include_types) if include_types else None,
+                "recursive": "true",
+                # si la biblioteca supera max_items, el pool es una muestra aleatoria que cambia en cada refresco
+                "sortBy": "Random",
+                "limit": str(self.pools.max_items),
+                "fields": "PrimaryImageAspectRatio",  # ligero
+            }
+            return self.jf.get_items({k: v for k, v in params.items() if v is not None})
+
+        return self.pools.get(key, load, force)
 
-    def _store(self, key: str, ttl: int, payload: Dict[str, Any]) -> None:
-        self.cache[key] = CacheEntry(expires_at=time.time() + max(1, ttl), payload=payload)
+    def _top_rated_pool(self, min_rating: float, pool_limit: int, include_types: List[str],
+                        force: bool = False) -> Tuple["PoolItem", ...]:
+        """Los pool_limit mejor valorados de toda la biblioteca (no una muestra del pool "all"), ya ordenados."""
+        key: PoolKey = ("top_rated", f"{min_rating:g}:{pool_limit}", join_csv(sorted(include_types)))
+
+        def load() -> List[Dict[str, Any]]:
+            params = {
+                "includeItemTypes": join_csv(include_types) if include_types else None,
+                "recursive": "true",
+                "minCommunityRating": str(min_rating),
+                "sortBy": "CommunityRating",
+                "sortOrder": "Descending",
+                "limit": str(pool_limit),
+                "fields": "PrimaryImageAspectRatio",
+            }
+            return self.jf.get_items({k: v for k, v in params.items() if v is not None})
+
+        return self.pools.get(key, load, force)
 
     def resolve_library_ids(self, user_id: str) -> Dict[str, str]:
-        views = self.jf.get_views(user_id)
-        out: Dict[str, str] = {}
-        for v in views:
-            vid = v.get("Id") or v.get("id")
-            name = v.get("Name") or v.get("name")
-            if vid and name:
-                out[str(name)] = str(vid)
-        return out
+        def load() -> Dict[str, str]:
+            out: Dict[str, str] = {}
+            for v in self.jf.get_views(user_id):
+                vid = v.get("Id") or v.get("id")
+                name = v.get("Name") or v.get("name")
+                if vid and name:
+                    out[str(name)] = str(vid)
+            return out
+
+        return self.lookups.get(("views", user_id), load)
+
+    def resolve_boxset_id(self, name: str, force: bool = False) -> Optional[str]:
+        return self.lookups.get(("boxset", name.strip().casefold()), lambda: self.jf.find_boxset_id_by_name(name),
+                                max_age=self.pools.min_reload_seconds if force else None)
+
+    def prewarm(self, user_ids: List[str]) -> None:
+        """Resuelve en segundo plano las colecciones del YAML (y las bibliotecas de user_ids) antes de la 1ª visita."""
+        names = {
+            str(sec.get("collection_name") or "").strip()
+            for sec in (self.cfg.get("sections") or [])
+            if isinstance(sec, dict) and sec.get("type") == "random_from_collection"
+        }
+        jobs = [(self.resolve_boxset_id, n) for n in sorted(names) if n]
+        jobs += [(self.resolve_library_ids, u) for u in user_ids if u]
 
-    def build_section(self, section: Dict[str, Any], user_id: str) -> Dict[str, Any]:
-        sid = str(section.get("id") or "")
+        def _run(fn, arg) -> None:
+            try:
+                fn(arg)
+            except Exception as e:
+                logging.warning("Precarga de %r falló: %r", arg, e)
+
+        for fn, arg in jobs:
+            self.fetch_pool.submit(_run, fn, arg)
+        if jobs:
+            logging.info("Precargando %d resoluciones (colecciones/bibliotecas)", len(jobs))
+
+    def _section_entry(self, section: Dict[str, Any], user_id: str, force_refresh: bool = False) -> CacheEntry:
         ttl = int(section.get("ttl_seconds") or 0)
-        if ttl > 0:
-            cached = self._cached(sid)
-            if cached:
+        if ttl <= 0:
+            return make_entry(self._build_section(section, user_id, force_refresh))
+
+        key = section_cache_key(section, user_id)
+        if not force_refresh:
+            cached, fresh = self.cache.lookup(key)
+            if cached is not None:
+                if not fresh:
+                    self.cache.revalidate(key, lambda: self._build_and_store(key, ttl, section, user_id))
                 return cached
+        return self._build_and_store(key, ttl, section, user_id, force_refresh)
 
+    def _build_and_store(self, key: CacheKey, ttl: int, section: Dict[str, Any], user_id: str,
+                         force: bool = False) -> CacheEntry:
+        return self.cache.store(key, ttl, self._build_section(section, user_id, force))
+
+    def _build_section(self, section: Dict[str, Any], user_id: str, force: bool = False) -> Dict[str, Any]:
+        """force (refresh=1): recarga los pools / colecciones que usa esta sección (ver ItemPoolStore)."""
+        sid = str(section.get("id") or "")
         stype = str(section.get("type") or "").strip()
         title = str(section.get("title") or sid)
 
@@ -262,21 +579,12 @@ class SectionEngine:
         include_types = [str(x) for x in include_types if str(x).strip()]
 
         limit = int(section.get("limit") or 30)
-        fields = "PrimaryImageAspectRatio"  # ligero
 
         payload: Dict[str, Any] = {"id": sid, "title": title, "type": stype, "items": [], "generatedAt": now_iso()}
 
         if stype == "random":
-            params = {
-                "includeItemTypes": join_csv(include_types) if include_types else None,
-                "recursive": "true",
-                "sortBy": "Random",
-                "limit": str(limit),
-                "fields": fields,
-            }
-            params = {k: v for k, v in params.items() if v is not None}
-            items = self.jf.get_items(params)
-            payload["items"] = [compact_item(i) for i in items]
+            pool = self._pool("all", "", include_types, force)
+            payload["items"] = [it.to_dict() for it in self._sample(pool, limit)]
 
         elif stype == "random_mix_libraries":
             libs = section.get("libraries") or []
@@ -286,146 +594,234 @@ class SectionEngine:
             per_pool = int(section.get("per_library_pool") or 120)
 
             name_to_id = self.resolve_library_ids(user_id)
-            pool: List[Dict[str, Any]] = []
+            futures = []
             for libname in libs:
                 pid = name_to_id.get(libname)
                 if not pid:
                     logging.warning("Sección %s: biblioteca no encontrada: %s", sid, libname)
                     continue
-                params = {
-                    "parentId": pid,
-                    "includeItemTypes": join_csv(include_types) if include_types else None,
-                    "recursive": "true",
-                    "sortBy": "Random",
-                    "limit": str(per_pool),
-                    "fields": fields,
-                }
-                params = {k: v for k, v in params.items() if v is not None}
-                pool.extend(self.jf.get_items(params))
+                futures.append(self.fetch_pool.submit(self._pool, "library", pid, include_types, force))
+            mixed: List[PoolItem] = []
+            for fut in futures:
+                mixed.extend(self._sample(fut.result(), per_pool))
 
             # baraja + recorta
-            self.rng.shuffle(pool)
-            payload["items"] = [compact_item(i) for i in pool[:limit]]
+            payload["items"] = [it.to_dict() for it in self._sample(mixed, limit)]
 
         elif stype == "random_from_collection":
             cname = str(section.get("collection_name") or "").strip()
             if not cname:
                 raise RuntimeError(f"Sección {sid}: collection_name vacío")
-            boxset_id = self.jf.find_boxset_id_by_name(cname)
+            boxset_id = self.resolve_boxset_id(cname, force)
             if not boxset_id:
                 logging.warning("Sección %s: NO encontrada colección %r", sid, cname)
                 payload["items"] = []
             else:
-                params = {
-                    "parentId": boxset_id,
-                    "includeItemTypes": join_csv(include_types) if include_types else None,
-                    "recursive": "true",
-                    "sortBy": "Random",
-                    "limit": str(limit),
-                    "fields": fields,
-                }
-                params = {k: v for k, v in params.items() if v is not None}
-                items = self.jf.get_items(params)
-                payload["items"] = [compact_item(i) for i in items]
+                pool = self._pool("collection", boxset_id, include_types, force)
+                if not pool:
+                    # colección vacía o recreada con otro id: que el próximo build la vuelva a buscar
+                    self.lookups.invalidate("boxset", cname.casefold())
+                payload["items"] = [it.to_dict() for it in self._sample(pool, limit)]
 
         elif stype == "random_from_genre":
             genre = str(section.get("genre") or "").strip()
             if not genre:
                 raise RuntimeError(f"Sección {sid}: genre vacío")
-            params = {
-                "includeItemTypes": join_csv(include_types) if include_types else None,
-                "recursive": "true",
-                "genres": join_pipe([genre]),   # Jellyfin espera pipe-delimited
-                "sortBy": "Random",
-                "limit": str(limit),
-                "fields": fields,
-            }
-            params = {k: v for k, v in params.items() if v is not None}
-            items = self.jf.get_items(params)
-            payload["items"] = [compact_item(i) for i in items]
+            pool = self._pool("genre", genre, include_types, force)
+            payload["items"] = [it.to_dict() for it in self._sample(pool, limit)]
 
         elif stype == "top_rated_shuffle":
             min_rating = float(section.get("min_community_rating") or 7.5)
             pool_limit = int(section.get("pool_limit") or 300)
-            params = {
-                "includeItemTypes": join_csv(include_types) if include_types else None,
-                "recursive": "true",
-                "minCommunityRating": str(min_rating),
-                "sortBy": "CommunityRating",
-                "sortOrder": "Descending",
-                "limit": str(pool_limit),
-                "fields": fields,
-            }
-            params = {k: v for k, v in params.items() if v is not None}
-            pool = self.jf.get_items(params)
-            self.rng.shuffle(pool)
-            payload["items"] = [compact_item(i) for i in pool[:limit]]
+            pool = self._top_rated_pool(min_rating, pool_limit, include_types, force)
+            payload["items"] = [it.to_dict() for it in self._sample(pool, limit)]
 
         else:
             raise RuntimeError(f"Tipo de sección no soportado: {stype}")
 
-        if ttl > 0:
-            self._store(sid, ttl, payload)
-
         return payload
 
-    def build_all(self, user_id: str, force_refresh: bool = False) -> Dict[str, Any]:
+    def _build_all_entries(self, user_id: str, force_refresh: bool) -> List[CacheEntry]:
         if force_refresh:
-            self.cache.clear()
+            self.lookups.invalidate("views", user_id)
 
         sections = self.cfg.get("sections") or []
         if not isinstance(sections, list):
             raise RuntimeError("cfg.sections debe ser una lista")
 
-        out_sections: List[Dict[str, Any]] = []
-        for sec in sections:
-            if not isinstance(sec, dict):
-                continue
+        secs = [sec for sec in sections if isinstance(sec, dict)]
+        futures = [self.section_pool.submit(self._section_entry, sec, user_id, force_refresh) for sec in secs]
+
+        out: List[CacheEntry] = []
+        for sec, fut in zip(secs, futures):
+            key = section_cache_key(sec, user_id)
             try:
-                out_sections.append(self.build_section(sec, user_id=user_id))
+                out.append(fut.result())
+                self.failed_since.pop(key, None)
             except Exception as e:
                 sid = sec.get("id")
                 logging.exception("Error generando sección %r: %r", sid, e)
-                out_sections.append({
+                # generatedAt = inicio de la racha de fallos, no "ahora": una sección rota no cambia el ETag
+                out.append(make_entry({
                     "id": sid,
                     "title": sec.get("title") or sid,
                     "type": sec.get("type"),
                     "items": [],
                     "error": str(e),
-                    "generatedAt": now_iso(),
-                })
+                    "generatedAt": self.failed_since.setdefault(key, now_iso()),
+                }))
+        return out
 
-        return {
-            "generatedAt": now_iso(),
-            "userId": user_id,
-            "sections": out_sections,
-        }
+    @staticmethod
+    def _generated_at(entries: List[CacheEntry]) -> str:
+        # la sección más reciente, no "ahora": si nada ha cambiado, la respuesta (y su ETag) tampoco
+        stamps = [str(e.payload.get("generatedAt") or "") for e in entries if "error" not in e.payload]
+        if not stamps:
+            stamps = [str(e.payload.get("generatedAt") or "") for e in entries]
+        return max(stamps, default="") or now_iso()
+
+    def build_all_encoded(self, user_id: str, force_refresh: bool = False) -> Tuple[bytes, str]:
+        """Respuesta {generatedAt, userId, sections} ya en JSON, pegando los bytes guardados de cada sección. Devuelve (body, etag)."""
+        entries = self._build_all_entries(user_id, force_refresh)
+        head = json.dumps({"generatedAt": self._generated_at(entries), "userId": user_id},
+                          ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        body = head[:-1] + b',"sections":[' + b",".join(e.body for e in entries) + b"]}"
+        h = hashlib.sha1(head)
+        for e in entries:
+            h.update(e.etag.encode("ascii"))
+        return body, h.hexdigest()[:20]
 
 
 # -------------------------
 # HTTP server
 # -------------------------
 
+def parse_accept_encoding(header: str) -> Dict[str, float]:
+    """"gzip, br;q=0.8, *;q=0" -> {"gzip": 1.0, "br": 0.8, "*": 0.0}"""
+    out: Dict[str, float] = {}
+    for part in (header or "").split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        out[token] = q
+    return out
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Comparación débil (RFC 9110): ignora W/ y el sufijo de codificación de nuestras variantes."""
+    for tag in (if_none_match or "").split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return True
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        tag = tag.strip('"')
+        for suffix in ("-gzip", "-br"):
+            if tag.endswith(suffix):
+                tag = tag[: -len(suffix)]
+        if tag == etag:
+            return True
+    return False
+
+
+class EncodedBodies:
+    """LRU etag -> {codificación: bytes}: cada respuesta se comprime una sola vez."""
+
+    MIN_SIZE = 512  # por debajo no compensa comprimir
+
+    def __init__(self, max_entries: int = 128) -> None:
+        self.max_entries = max(1, max_entries)
+        self.entries: "OrderedDict[str, Dict[str, bytes]]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def choose(self, accept_encoding: str, size: int) -> str:
+        if size < self.MIN_SIZE:
+            return "identity"
+        accepted = parse_accept_encoding(accept_encoding)
+        star = accepted.get("*", 0.0)
+        for enc in ("br", "gzip"):
+            if enc == "br" and brotli is None:
+                continue
+            if accepted.get(enc, star) > 0:
+                return enc
+        return "identity"
+
+    def get(self, etag: str, body: bytes, encoding: str) -> bytes:
+        if encoding == "identity":
+            return body
+        with self.lock:
+            variants = self.entries.get(etag)
+            if variants is not None:
+                self.entries.move_to_end(etag)
+                if encoding in variants:
+                    return variants[encoding]
+        data = brotli.compress(body, quality=5) if encoding == "br" else gzip.compress(body, compresslevel=6)
+        with self.lock:
+            self.entries.setdefault(etag, {})[encoding] = data
+            self.entries.move_to_end(etag)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return data
+
+
 class Handler(BaseHTTPRequestHandler):
     engine: SectionEngine
     cors_allow_origin: str
+    encoded: EncodedBodies = EncodedBodies()
+
+    def _send_cors(self) -> None:
+        self.send_header("Access-Control-Allow-Origin", self.cors_allow_origin)
+        self.send_header("Access-Control-Allow-Methods", "GET, OPTIONS")
+        self.send_header("Access-Control-Allow-Headers", "Content-Type, If-None-Match")
+        self.send_header("Access-Control-Expose-Headers", "ETag")
 
     def _send_json(self, obj: Any, status: int = 200) -> None:
         body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
         self.send_response(status)
         self.send_header("Content-Type", "application/json; charset=utf-8")
         self.send_header("Content-Length", str(len(body)))
-        self.send_header("Access-Control-Allow-Origin", self.cors_allow_origin)
-        self.send_header("Access-Control-Allow-Methods", "GET, OPTIONS")
-        self.send_header("Access-Control-Allow-Headers", "Content-Type")
+        self._send_cors()
         self.end_headers()
         self.wfile.write(body)
 
+    def _send_cached_json(self, body: bytes, etag: str) -> None:
+        """200 (comprimido si el cliente lo acepta) o 304 si su If-None-Match ya tiene este ETag."""
+        encoding = self.encoded.choose(self.headers.get("Accept-Encoding", ""), len(body))
+        tag = f'"{etag}"' if encoding == "identity" else f'"{etag}-{encoding}"'
+
+        if etag_matches(self.headers.get("If-None-Match", ""), etag):
+            self.send_response(304)
+            self.send_header("ETag", tag)
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Vary", "Accept-Encoding")
+            self._send_cors()
+            self.end_headers()
+            return
+
+        data = self.encoded.get(etag, body, encoding)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        if encoding != "identity":
+            self.send_header("Content-Encoding", encoding)
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("ETag", tag)
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Vary", "Accept-Encoding")
+        self._send_cors()
+        self.end_headers()
+        self.wfile.write(data)
+
     def do_OPTIONS(self) -> None:
         self.send_response(204)
-        self.send_header("Access-Control-Allow-Origin", self.cors_allow_origin)
-        self.send_header("Access-Control-Allow-Methods", "GET, OPTIONS")
-        self.send_header("Access-Control-Allow-Headers", "Content-Type")
+        self._send_cors()
         self.end_headers()
 
     def do_GET(self) -> None:
@@ -444,8 +840,8 @@ class Handler(BaseHTTPRequestHandler):
                 )
 
             force = ((qs.get("refresh") or ["0"])[0] == "1")
-            data = self.engine.build_all(user_id=user_id, force_refresh=force)
-            return self._send_json(data)
+            body, etag = self.engine.build_all_encoded(user_id=user_id, force_refresh=force)
+            return self._send_cached_json(body, etag)
 
         return self._send_json({"error": "not_found"}, status=404)
 
@@ -495,6 +891,8 @@ def main() -> int:
         retry_base_sleep=retry_sleep,
     )
     engine = SectionEngine(jf=jf, cfg=cfg)
+    warm_users = (cfg.get("lookups") or {}).get("warm_user_ids") or []
+    engine.prewarm([str(u) for u in warm_users] if isinstance(warm_users, list) else [str(warm_users)])
 
     Handler.engine = engine
     Handler.cors_allow_origin = cors
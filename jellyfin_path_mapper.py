@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Jellyfin path mapper (Windows host paths -> container paths)
+
+Compiled prefix-map rules shared by the Jellyfin tools that need to translate paths such as
+`F:\\Peliculas\\X.mkv` into what a container sees (`/media_f/Peliculas/X.mkv`).
+
+- Rules are FROM=>TO string prefixes. Slashes are normalized once, at compile time.
+- Rules live in a trie keyed by path segments, so mapping a path costs O(path segments), not O(rules).
+- Semantics match a plain `path.startswith(FROM)` check: a FROM without a trailing slash also matches a
+  partial last segment ("/media" matches "/media_e/...").
+- Every matching rule produces a candidate, longest FROM first (ties keep rule order), de-duplicated by norm_key.
+
+Usage:
+    from jellyfin_path_mapper import PathMapper
+    mapper = PathMapper([("F:\\\\", "/media_f/")])
+    mapper.map(r"F:\\Peliculas\\X.mkv")         # "/media_f/Peliculas/X.mkv"
+    mapper.candidates(r"F:\\Peliculas\\X.mkv")  # [original, slash-normalized, mapped...]
+"""
+
+from __future__ import annotations
+
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+
+def normalize_slashes(p: str) -> str:
+    return p.replace("\\", "/")
+
+
+def norm_key(p: str) -> str:
+    return normalize_slashes(p).casefold().strip()
+
+
+def parse_rule(x: str) -> Tuple[str, str]:
+    """Parse a FROM=>TO rule (CLI / env format)."""
+    if "=>" not in x:
+        raise ValueError(f"Invalid path map '{x}'. Expected FROM=>TO")
+    a, b = x.split("=>", 1)
+    return (a, b)
+
+
+def dedup_by_key(paths: Iterable[str]) -> List[str]:
+    seen: Set[str] = set()
+    out: List[str] = []
+    for p in paths:
+        k = norm_key(p)
+        if k not in seen:
+            seen.add(k)
+            out.append(p)
+    return out
+
+
+class _Node:
+    __slots__ = ("children", "rules")
+
+    def __init__(self) -> None:
+        self.children: Dict[str, _Node] = {}
+        # Rules whose FROM has exactly this node's segments before its last "/": (tail, rank, from_len, to).
+        # tail is the part after that "/" ("" for FROMs ending in "/") and must prefix the next path segment.
+        self.rules: List[Tuple[str, int, int, str]] = []
+
+
+class PathMapper:
+    def __init__(self, rules: Iterable[Tuple[str, str]] = ()) -> None:
+        self.rules: List[Tuple[str, str]] = [(normalize_slashes(f), normalize_slashes(t)) for f, t in rules]
+        self._root = _Node()
+        for rank, (frm, to) in enumerate(self.rules):
+            *segments, tail = frm.split("/")
+            node = self._root
+            for seg in segments:
+                node = node.children.setdefault(seg, _Node())
+            node.rules.append((tail, rank, len(frm), to))
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def mapped(self, path: str) -> List[str]:
+        """All mapped variants of `path` (without the original), longest matching FROM first."""
+        p_norm = normalize_slashes(path)
+        segs = p_norm.split("/")
+        hits: List[Tuple[int, int, str]] = []  # (-from_len, rank, mapped)
+        node: Optional[_Node] = self._root
+        depth = 0
+        while node is not None and depth < len(segs):
+            for tail, rank, flen, to in node.rules:
+                if segs[depth].startswith(tail):
+                    hits.append((-flen, rank, to + p_norm[flen:]))
+            node = node.children.get(segs[depth])
+            depth += 1
+        hits.sort()
+        return dedup_by_key(m for _, _, m in hits)
+
+    def map(self, path: str) -> Optional[str]:
+        """Best (longest-prefix) mapping of `path`, or None if no rule matches."""
+        m = self.mapped(path)
+        return m[0] if m else None
+
+    def candidates(self, path: str) -> List[str]:
+        """Original path, slash-normalized path and every mapped variant, de-duplicated by norm_key."""
+        return dedup_by_key([path, normalize_slashes(path), *self.mapped(path)])
@@ -7,13 +7,42 @@ Sync Jellyfin BoxSets (Collections) -> ErsatzTV Manual Collections via SQLite (h
 Key properties (kept from your working script):
 - Multi-kind resolver for MediaItemId:
   MediaFile.Path -> MediaVersion -> {MovieId/EpisodeId/SongId/...} -> MediaItemId via COALESCE
-- Path candidate generation supports optional prefix maps (--path-map)
+- Path candidate generation supports optional prefix maps (--path-map), compiled once into a
+  jellyfin_path_mapper.PathMapper (segment trie shared with the other Jellyfin tools)
+
+Incremental mode (--incremental):
+- Each BoxSet gets a fingerprint (Etag / DateLastMediaAdded / ChildCount / RecursiveItemCount) stored in the
+  state file, together with a hash of its child ids+paths.
+- On the next run only BoxSets whose fingerprint moved, that still had paths unresolved in ErsatzTV, or whose
+  entry is older than --incremental-max-age-hours are re-fetched and re-diffed. Unchanged collections are left
+  untouched, so a no-op run is just one BoxSet listing.
+
+Jellyfin fetch strategy (--jf-strategy):
+- boxset (default): one recursive ParentId=<boxset> query per collection (Path included every time).
+- inventory: one paged scan over all playable items (Path + container ids), plus an id-only listing of each
+  BoxSet's direct members; Series/Season/Album members are expanded from the in-memory index. A movie that
+  sits in 10 collections is transferred once instead of 10 times.
 
 New in this version (requested):
 - If a collection is deleted from Jellyfin, the corresponding MANAGED manual collection is deleted from ErsatzTV.
   This is implemented safely using a small local state file (JSON) so we only delete collections that this script
   has created/adopted previously (avoids touching unrelated manual collections).
 
+Writes:
+- Path resolution and membership diffs are computed BEFORE taking the write lock.
+- Under BEGIN IMMEDIATE, current membership is re-read in bulk and removes/adds are written with executemany,
+  so ErsatzTV is blocked only for the actual writes.
+- --txn-mode per-collection (default) uses one short transaction per collection; batch uses a single one.
+  SQLITE_BUSY is retried with jittered backoff (--busy-timeout-ms / --lock-retries / --lock-backoff-ms), and the
+  summary reports how long we waited for and held the write lock.
+
+Plan files (--plan-out / --apply-plan):
+- A dry-run can write its plan (per-collection adds/removes, deletes, BoxSet fingerprints and the DB schema
+  fingerprint) to a compact JSON file for review.
+- --apply-plan applies exactly that plan without querying Jellyfin. It refuses to run if the ErsatzTV schema
+  fingerprint changed since the plan was made or the plan is older than --plan-max-age-hours; adds already
+  present / removes already gone, and adds of MediaItems ErsatzTV has since removed, are skipped.
+
 Important behavior:
 - By default, deletion sync is ENABLED (can be disabled with --no-delete-missing-collections).
 - By default, existing matching collections are ADOPTED into management state (can be disabled with --no-adopt-existing).
@@ -29,23 +58,37 @@ Usage (PowerShell):
 
   Apply:
     python ./sync_jellyfin_collections_to_ersatztv_sqlite.py --apply --verbose
+
+  Apply (incremental, cron):
+    python ./sync_jellyfin_collections_to_ersatztv_sqlite.py --apply --incremental
+
+  Review, then apply:
+    python ./sync_jellyfin_collections_to_ersatztv_sqlite.py --dry-run --plan-out ./etv_plan.json
+    python ./sync_jellyfin_collections_to_ersatztv_sqlite.py --apply-plan ./etv_plan.json
 """
 
 from __future__ import annotations
 
 import argparse
+import hashlib
 import json
 import os
+import random
 import re
 import shutil
 import sqlite3
+import time
 import uuid
-from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
 from datetime import datetime
 from pathlib import Path
 from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
 
 import requests
+from requests.adapters import HTTPAdapter
+
+from jellyfin_path_mapper import PathMapper, norm_key, parse_rule
 
 
 # ============================================================
@@ -95,17 +138,22 @@ def default_state_file() -> Path:
     return Path(__file__).with_name(".etv_jf_collection_sync_state.json")
 
 
+def empty_state() -> Dict[str, Any]:
+    return {"version": 1, "managed": {}, "boxsets": {}, "schema_cache": {}}
+
+
 def load_state(path: Path) -> Dict[str, Any]:
     if not path.exists():
-        return {"version": 1, "managed": {}}
+        return empty_state()
     try:
         data = json.loads(path.read_text(encoding="utf-8"))
         if not isinstance(data, dict):
-            return {"version": 1, "managed": {}}
+            return empty_state()
         data.setdefault("version", 1)
-        data.setdefault("managed", {})
-        if not isinstance(data["managed"], dict):
-            data["managed"] = {}
+        for key in ("managed", "boxsets", "schema_cache"):
+            data.setdefault(key, {})
+            if not isinstance(data[key], dict):
+                data[key] = {}
         return data
     except Exception:
         try:
@@ -113,7 +161,7 @@ def load_state(path: Path) -> Dict[str, Any]:
             shutil.copy2(path, bak)
         except Exception:
             pass
-        return {"version": 1, "managed": {}}
+        return empty_state()
 
 
 def save_state(path: Path, state: Dict[str, Any]) -> None:
@@ -127,6 +175,20 @@ def save_state(path: Path, state: Dict[str, Any]) -> None:
 # Jellyfin
 # ============================================================
 
+PLAYABLE_TYPES = ("Movie", "Episode", "MusicVideo", "Video", "Audio")
+
+# Container ids a playable can hang from; used to expand Series/Season/Album/Folder members of a BoxSet.
+CONTAINER_ID_FIELDS = ("SeriesId", "SeasonId", "AlbumId", "ParentId")
+
+
+def parallel_map(fn, seq: Sequence[Any], concurrency: int) -> List[Any]:
+    """map() over a bounded thread pool; results keep the input order."""
+    if concurrency <= 1 or len(seq) <= 1:
+        return [fn(x) for x in seq]
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="jf") as pool:
+        return list(pool.map(fn, seq))
+
+
 @dataclass(frozen=True)
 class JfItem:
     jf_id: str
@@ -136,9 +198,13 @@ class JfItem:
 
 
 class JellyfinClient:
-    def __init__(self, base_url: str, api_key: str) -> None:
+    def __init__(self, base_url: str, api_key: str, pool_size: int = 10) -> None:
         self.base_url = base_url.rstrip("/")
         self.s = requests.Session()
+        # One shared session for all worker threads; size the pool so they don't fight for connections.
+        adapter = HTTPAdapter(pool_connections=max(1, pool_size), pool_maxsize=max(1, pool_size))
+        self.s.mount("http://", adapter)
+        self.s.mount("https://", adapter)
         self.s.headers.update({
             "X-Emby-Token": api_key,
             "Accept": "application/json",
@@ -188,10 +254,11 @@ class JellyfinClient:
         return out
 
     def list_boxsets(self, user_id: str) -> List[Dict[str, Any]]:
+        # Change-token fields are cheap to return and feed boxset_fingerprint().
         return self.paged_items(user_id, {
             "IncludeItemTypes": "BoxSet",
             "Recursive": "true",
-            "Fields": "Id,Name",
+            "Fields": "Id,Name,Etag,DateLastMediaAdded,ChildCount,RecursiveItemCount",
             "EnableTotalRecordCount": "true",
         })
 
@@ -203,67 +270,148 @@ class JellyfinClient:
             "EnableTotalRecordCount": "true",
         })
 
+    def list_boxset_member_ids(self, user_id: str, boxset_id: str) -> List[Tuple[str, str]]:
+        """Direct (non-recursive) members of a BoxSet as (id, type); no Path, no images -> tiny payload."""
+        raw = self.paged_items(user_id, {
+            "ParentId": boxset_id,
+            "EnableImages": "false",
+            "EnableUserData": "false",
+            "EnableTotalRecordCount": "true",
+        })
+        return [(str(it["Id"]), (it.get("Type") or "").strip()) for it in raw if it.get("Id")]
+
+    def list_playable_inventory(self, user_id: str) -> List[Dict[str, Any]]:
+        """Every playable item in the library, once, with Path and container ids."""
+        return self.paged_items(user_id, {
+            "IncludeItemTypes": ",".join(PLAYABLE_TYPES),
+            "Recursive": "true",
+            "Fields": "Path,ParentId",
+            "EnableImages": "false",
+            "EnableUserData": "false",
+            "EnableTotalRecordCount": "true",
+        }, page_size=2000)
+
     def boxset_playables(self, user_id: str, boxset_id: str) -> List[JfItem]:
         raw = self.list_boxset_children_recursive(user_id, boxset_id)
-        playable_types = {"Movie", "Episode", "MusicVideo", "Video", "Audio"}
         out: List[JfItem] = []
         for it in raw:
-            t = (it.get("Type") or "").strip()
-            if t not in playable_types:
+            item = jf_item_from_raw(it)
+            if item:
+                out.append(item)
+        return out
+
+    def boxsets_playables(self, user_id: str, boxset_ids: Sequence[str], concurrency: int = 1) -> List[List[JfItem]]:
+        """Fetch playables for many BoxSets; results are returned in the same order as boxset_ids."""
+        return parallel_map(lambda bs_id: self.boxset_playables(user_id, bs_id), boxset_ids, concurrency)
+
+    def boxsets_playables_inventory(self, user_id: str, boxset_ids: Sequence[str], concurrency: int = 1) -> List[List[JfItem]]:
+        """
+        Same result as boxsets_playables(), but each playable (and its Path) is transferred only once:
+        one paged scan over the library plus id-only membership listings per BoxSet.
+        """
+        members = dict(zip(boxset_ids, parallel_map(lambda bs_id: self.list_boxset_member_ids(user_id, bs_id), boxset_ids, concurrency)))
+        inventory = JfInventory(self.list_playable_inventory(user_id))
+
+        def member_lookup(bs_id: str) -> List[Tuple[str, str]]:
+            # Nested BoxSets outside the requested set are resolved lazily (rare).
+            if bs_id not in members:
+                members[bs_id] = self.list_boxset_member_ids(user_id, bs_id)
+            return members[bs_id]
+
+        return [inventory.expand_boxset(bs_id, member_lookup) for bs_id in boxset_ids]
+
+
+def jf_item_from_raw(it: Dict[str, Any]) -> Optional[JfItem]:
+    t = (it.get("Type") or "").strip()
+    if t not in PLAYABLE_TYPES:
+        return None
+    jf_id = it.get("Id") or ""
+    name = it.get("Name") or ""
+    path = it.get("Path") or ""
+    if jf_id and path:
+        return JfItem(jf_id=jf_id, jf_type=t, name=name, path=path)
+    return None
+
+
+class JfInventory:
+    """In-memory index over a single library scan: playable id -> item, container id -> playables."""
+
+    def __init__(self, raw_items: Iterable[Dict[str, Any]]) -> None:
+        self.by_id: Dict[str, JfItem] = {}
+        self.by_container: Dict[str, List[JfItem]] = {}
+        for it in raw_items:
+            item = jf_item_from_raw(it)
+            if not item:
+                continue
+            self.by_id[item.jf_id] = item
+            for id_field in CONTAINER_ID_FIELDS:
+                cid = it.get(id_field)
+                if cid:
+                    self.by_container.setdefault(str(cid), []).append(item)
+
+    def expand_boxset(self, boxset_id: str, member_lookup) -> List[JfItem]:
+        out: List[JfItem] = []
+        seen_items: Set[str] = set()
+        seen_boxsets: Set[str] = {boxset_id}
+        stack = list(reversed(member_lookup(boxset_id)))
+        while stack:
+            mid, mtype = stack.pop()
+            if mtype == "BoxSet":
+                if mid not in seen_boxsets:
+                    seen_boxsets.add(mid)
+                    stack.extend(reversed(member_lookup(mid)))
                 continue
-            jf_id = it.get("Id") or ""
-            name = it.get("Name") or ""
-            path = it.get("Path") or ""
-            if jf_id and path:
-                out.append(JfItem(jf_id=jf_id, jf_type=t, name=name, path=path))
+            direct = self.by_id.get(mid)
+            for item in ([direct] if direct else self.by_container.get(mid, [])):
+                if item.jf_id not in seen_items:
+                    seen_items.add(item.jf_id)
+                    out.append(item)
         return out
 
 
 # ============================================================
-# Path mapping
+# Incremental fingerprints
 # ============================================================
 
-def normalize_slashes(p: str) -> str:
-    return p.replace("\\", "/")
-
-
-def norm_key(p: str) -> str:
-    return normalize_slashes(p).casefold().strip()
-
-
-def apply_prefix_maps(original: str, maps: List[Tuple[str, str]]) -> List[str]:
-    """Apply prefix replacement rules; treated as simple string prefixes."""
-    p_norm = normalize_slashes(original)
-    out: List[str] = []
-    for frm, to in sorted(maps, key=lambda x: len(x[0]), reverse=True):
-        frm_norm = normalize_slashes(frm)
-        to_norm = normalize_slashes(to)
-        if p_norm.startswith(frm_norm):
-            out.append(to_norm + p_norm[len(frm_norm):])
-    # de-dup
-    seen: Set[str] = set()
-    uniq: List[str] = []
-    for x in out:
-        k = norm_key(x)
-        if k not in seen:
-            seen.add(k)
-            uniq.append(x)
-    return uniq
-
-
-def candidate_paths(jf_path: str, maps: List[Tuple[str, str]], enable_maps: bool) -> List[str]:
-    cands = [jf_path, normalize_slashes(jf_path)]
-    if enable_maps:
-        cands.extend(apply_prefix_maps(jf_path, maps))
-    # de-dup
-    seen: Set[str] = set()
-    out: List[str] = []
-    for c in cands:
-        k = norm_key(c)
-        if k not in seen:
-            seen.add(k)
-            out.append(c)
-    return out
+def _sha1_json(obj: Any) -> str:
+    raw = json.dumps(obj, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def boxset_fingerprint(bs: Dict[str, Any]) -> str:
+    """Change token for a BoxSet, built only from fields returned by list_boxsets()."""
+    return _sha1_json([
+        bs.get("Etag") or "",
+        bs.get("DateLastMediaAdded") or "",
+        bs.get("ChildCount"),
+        bs.get("RecursiveItemCount"),
+    ])
+
+
+def items_fingerprint(items: Sequence[JfItem]) -> str:
+    """ETag-style hash of the playable children (id + path), order independent."""
+    return _sha1_json(sorted([it.jf_id, it.path] for it in items))
+
+
+def sync_config_fingerprint(maps: List[Tuple[str, str]], enable_maps: bool) -> str:
+    """Anything that changes path resolution invalidates every stored BoxSet fingerprint."""
+    return _sha1_json({"maps": sorted(maps) if enable_maps else [], "enable_maps": enable_maps})
+
+
+def boxset_entry_is_recent(entry: Dict[str, Any], bs_id: str, config_fp: str, max_age_hours: float) -> bool:
+    """True if a stored BoxSet entry can be trusted (same BoxSet, same path config, not older than max age)."""
+    if not isinstance(entry, dict):
+        return False
+    if entry.get("jf_id") != bs_id or entry.get("config") != config_fp:
+        return False
+    if max_age_hours > 0:
+        try:
+            synced_at = datetime.fromisoformat(str(entry.get("synced_at") or ""))
+        except ValueError:
+            return False
+        if (datetime.now() - synced_at).total_seconds() > max_age_hours * 3600:
+            return False
+    return True
 
 
 # ============================================================
@@ -310,6 +458,61 @@ class Schema:
 
     resolver_specs: List[ResolverSpec]
 
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "Schema":
+        d = dict(d)
+        d["resolver_specs"] = [ResolverSpec(**rs) for rs in d.get("resolver_specs") or []]
+        return cls(**d)
+
+
+@dataclass
+class CollectionPlan:
+    """Desired membership of one ErsatzTV collection plus the diff against the DB."""
+    name: str
+    collection_id: Optional[int]  # None -> collection must be created
+    desired: Set[int]
+    missing_paths: List[str] = field(default_factory=list)
+    to_add: List[int] = field(default_factory=list)
+    to_remove: List[int] = field(default_factory=list)
+    pinned: bool = False  # loaded from a plan file: to_add/to_remove are fixed and `desired` is not known
+
+    def diff_against(self, current: Set[int]) -> None:
+        if self.pinned:
+            # Keep the planned diff; only drop what is already in place.
+            self.to_add = sorted(set(self.to_add) - current)
+            self.to_remove = sorted(set(self.to_remove) & current)
+            return
+        self.to_add = sorted(self.desired - current)
+        self.to_remove = sorted(current - self.desired)
+
+
+@dataclass
+class LockStats:
+    """Write-lock metrics: time spent waiting for BEGIN IMMEDIATE and time the lock was held."""
+    txns: int = 0
+    retries: int = 0
+    wait_s: float = 0.0
+    hold_s: float = 0.0
+    max_wait_s: float = 0.0
+    max_hold_s: float = 0.0
+
+    def summary(self) -> str:
+        return (f"txns={self.txns} retries={self.retries} "
+                f"wait={self.wait_s:.2f}s (max {self.max_wait_s:.2f}s) hold={self.hold_s:.2f}s (max {self.max_hold_s:.2f}s)")
+
+
+def is_busy_error(e: BaseException) -> bool:
+    if not isinstance(e, sqlite3.OperationalError):
+        return False
+    name = getattr(e, "sqlite_errorname", "") or ""
+    if name.startswith(("SQLITE_BUSY", "SQLITE_LOCKED")):
+        return True
+    msg = str(e).lower()
+    return "database is locked" in msg or "database is busy" in msg
+
 
 class ETVDb:
     def __init__(self, db_path: Path, busy_timeout_ms: int = 60000) -> None:
@@ -361,6 +564,33 @@ class ETVDb:
                 return t, c
         raise RuntimeError(f"Could not find any table with column '{colname}'")
 
+    @staticmethod
+    def schema_fingerprint(conn: sqlite3.Connection) -> str:
+        """PRAGMA schema_version changes on any DDL (i.e. ErsatzTV migrations); user_version on app-level bumps."""
+        sv = conn.execute("PRAGMA schema_version").fetchone()[0]
+        uv = conn.execute("PRAGMA user_version").fetchone()[0]
+        return f"{int(sv)}:{int(uv)}"
+
+    def load_schema(self, conn: sqlite3.Connection, cache: Dict[str, Any], verbose: bool, use_cache: bool = True) -> Schema:
+        """
+        Return the discovered Schema, reusing `cache` (a dict persisted in the state file) when the DB path and
+        schema fingerprint are unchanged. On a miss the schema is discovered and `cache` is updated in place.
+        """
+        fp = self.schema_fingerprint(conn)
+        if use_cache and cache.get("db") == str(self.db_path) and cache.get("fingerprint") == fp and cache.get("schema"):
+            try:
+                schema = Schema.from_dict(cache["schema"])
+                if verbose:
+                    log(f"Schema: cached (fingerprint={fp}); discovery skipped")
+                return schema
+            except (TypeError, KeyError) as e:
+                log(f"Schema cache unusable ({e}); rediscovering")
+
+        schema = self.discover_schema(conn, verbose=verbose)
+        cache.clear()
+        cache.update({"db": str(self.db_path), "fingerprint": fp, "schema": schema.to_dict()})
+        return schema
+
     def discover_schema(self, conn: sqlite3.Connection, verbose: bool) -> Schema:
         tables = self.list_tables(conn)
 
@@ -537,6 +767,46 @@ class ETVDb:
         uniq.sort(key=lambda x: (0 if x.direct else 1))
         return uniq
 
+    def write_txn(self, conn: sqlite3.Connection, fn, stats: LockStats, retries: int = 8,
+                  backoff_s: float = 0.5, backoff_max_s: float = 15.0) -> Any:
+        """
+        Run fn() inside BEGIN IMMEDIATE ... COMMIT. On SQLITE_BUSY (while taking the lock or committing) the
+        transaction is rolled back and retried with jittered exponential backoff, so fn() must be re-runnable.
+        Lock wait (including backoff sleeps) and hold times are accumulated into `stats`.
+        """
+        t_wait = time.monotonic()
+        attempt = 0
+        while True:
+            attempt += 1
+            t_lock: Optional[float] = None
+            try:
+                conn.execute("BEGIN IMMEDIATE;")
+                t_lock = time.monotonic()
+                stats.wait_s += t_lock - t_wait
+                stats.max_wait_s = max(stats.max_wait_s, t_lock - t_wait)
+                try:
+                    result = fn()
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+                finally:
+                    held = time.monotonic() - t_lock
+                    stats.hold_s += held
+                    stats.max_hold_s = max(stats.max_hold_s, held)
+                stats.txns += 1
+                return result
+            except sqlite3.OperationalError as e:
+                if not is_busy_error(e) or attempt >= retries:
+                    raise
+                stats.retries += 1
+                if t_lock is not None:
+                    # Lost the lock mid-transaction (busy on COMMIT): waiting starts over from here.
+                    t_wait = time.monotonic()
+                delay = min(backoff_max_s, backoff_s * (2 ** (attempt - 1))) * random.uniform(0.5, 1.5)
+                log(f"[WAIT] ErsatzTV DB busy (attempt {attempt}/{retries}): {e}; retrying in {delay:.1f}s")
+                time.sleep(delay)
+
     # Backup helpers
     def backup_vacuum_into(self, conn: sqlite3.Connection, backup_path: Path) -> None:
         backup_path.parent.mkdir(parents=True, exist_ok=True)
@@ -546,8 +816,48 @@ class ETVDb:
         backup_path.parent.mkdir(parents=True, exist_ok=True)
         shutil.copy2(self.db_path, backup_path)
 
+    def backup_online(self, conn: sqlite3.Connection, backup_path: Path, pages: int = 1024, pause_s: float = 0.05,
+                      max_s: float = 120.0) -> None:
+        """
+        SQLite online backup API, `pages` at a time with a pause between steps so ErsatzTV readers/writers
+        get the DB in between. Written to a .part file first so a failed backup never looks complete.
+
+        Every ErsatzTV write restarts a paced backup, so on a busy DB it may never finish: after `max_s` seconds
+        it is abandoned and redone in one step (all pages under a single read lock).
+        """
+        backup_path.parent.mkdir(parents=True, exist_ok=True)
+        part = backup_path.with_name(backup_path.name + ".part")
+        part.unlink(missing_ok=True)
+
+        deadline = time.monotonic() + max_s if max_s > 0 else None
+        restarts = 0
+        last_remaining: Optional[int] = None
+
+        def progress(status: int, remaining: int, total: int) -> None:
+            nonlocal restarts, last_remaining
+            if last_remaining is not None and remaining > last_remaining:
+                restarts += 1
+            last_remaining = remaining
+            if remaining and deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError(f"paced backup not done after {max_s:.0f}s ({restarts} restarts)")
+            if remaining and pause_s > 0:
+                time.sleep(pause_s)
+
+        dest = sqlite3.connect(str(part))
+        try:
+            try:
+                conn.backup(dest, pages=max(1, pages), progress=progress)
+            except TimeoutError as e:
+                log(f"[WARN] Online backup: {e}; falling back to a one-shot backup")
+                conn.backup(dest)
+        finally:
+            dest.close()
+        part.replace(backup_path)
+
     # Path resolution query
-    def _build_path_resolve_query(self, s: Schema, n_paths: int) -> str:
+    @staticmethod
+    def _resolver_joins(s: Schema) -> Tuple[str, str]:
+        """Return (JOIN clauses, COALESCE expression) resolving mv.* to a MediaItemId."""
         joins: List[str] = []
         join_map: Dict[str, str] = {}
         alias_i = 1
@@ -570,13 +880,17 @@ class ETVDb:
                 coalesce_terms.append(f"{alias}.{rs.media_item_fk_col}")
 
         coalesce_expr = "COALESCE(" + ", ".join(coalesce_terms) + ")"
+        return " ".join(joins), coalesce_expr
+
+    def _build_path_resolve_query(self, s: Schema, n_paths: int) -> str:
+        joins, coalesce_expr = self._resolver_joins(s)
         placeholders = ",".join(["?"] * n_paths)
 
         return (
             f"SELECT mf.{s.mediafile_path_col} AS p, {coalesce_expr} AS mid "
             f"FROM {s.mediafile_table} mf "
             f"JOIN {s.mediaversion_table} mv ON mf.{s.mediafile_mv_fk_col} = mv.{s.mediaversion_pk_col} "
-            + " ".join(joins)
+            + joins
             + f" WHERE mf.{s.mediafile_path_col} IN ({placeholders})"
         )
 
@@ -599,6 +913,60 @@ class ETVDb:
 
         return out, rows_found
 
+    def map_items_to_media_ids_temp(self, conn: sqlite3.Connection, s: Schema,
+                                    per_item_candidates: Dict[str, List[str]]) -> Dict[str, int]:
+        """
+        Resolve every item with one join instead of chunked IN (...) queries + Python probing.
+
+        Candidate paths are bulk-loaded (executemany) into two TEMP tables:
+          jf_path_key(pkey, path)          - every raw candidate path with its normalized key
+          jf_item_cand(jf_id, rank, pkey)  - candidate order per item
+        Raw paths that only differ in case or slashes share a key but are all probed, as the chunked
+        IN (...) mode does.
+        For each item the lowest-ranked candidate that resolves wins, same as probing the list in order.
+
+        Returns jf_id -> MediaItemId for the items that resolved.
+        """
+        own_txn = not conn.in_transaction
+        for t in ("jf_path_key", "jf_item_cand"):
+            conn.execute(f"DROP TABLE IF EXISTS temp.{t}")
+        conn.execute("CREATE TEMP TABLE jf_path_key (pkey TEXT NOT NULL, path TEXT NOT NULL, PRIMARY KEY (pkey, path))")
+        conn.execute("CREATE TEMP TABLE jf_item_cand (jf_id TEXT NOT NULL, rank INTEGER NOT NULL, pkey TEXT NOT NULL)")
+        try:
+            conn.executemany(
+                "INSERT OR IGNORE INTO temp.jf_path_key (pkey, path) VALUES (?,?)",
+                ((norm_key(c), c) for cands in per_item_candidates.values() for c in cands),
+            )
+            conn.executemany(
+                "INSERT INTO temp.jf_item_cand (jf_id, rank, pkey) VALUES (?,?,?)",
+                ((jf_id, rank, norm_key(c)) for jf_id, cands in per_item_candidates.items() for rank, c in enumerate(cands)),
+            )
+            conn.execute("CREATE INDEX temp.ix_jf_item_cand_pkey ON jf_item_cand (pkey)")
+            conn.execute("ANALYZE temp")
+
+            joins, coalesce_expr = self._resolver_joins(s)
+            resolved = (
+                f"SELECT k.pkey AS pkey, {coalesce_expr} AS mid "
+                f"FROM temp.jf_path_key k "
+                f"JOIN {s.mediafile_table} mf ON mf.{s.mediafile_path_col} = k.path "
+                f"JOIN {s.mediaversion_table} mv ON mf.{s.mediafile_mv_fk_col} = mv.{s.mediaversion_pk_col} "
+                + joins
+            )
+            # SQLite bare-column semantics: with MIN(rank), mid comes from the lowest-ranked resolved row.
+            rows = conn.execute(
+                f"SELECT c.jf_id AS jf_id, MIN(c.rank) AS rank, r.mid AS mid "
+                f"FROM temp.jf_item_cand c JOIN ({resolved}) r ON r.pkey = c.pkey "
+                f"WHERE r.mid IS NOT NULL GROUP BY c.jf_id"
+            ).fetchall()
+        finally:
+            for t in ("jf_path_key", "jf_item_cand"):
+                conn.execute(f"DROP TABLE IF EXISTS temp.{t}")
+            # Only TEMP tables were written; don't leave an implicit transaction open for a later BEGIN IMMEDIATE.
+            if own_txn and conn.in_transaction:
+                conn.commit()
+
+        return {str(r["jf_id"]): int(r["mid"]) for r in rows}
+
     # Collection ops
     def get_collection_id(self, conn: sqlite3.Connection, s: Schema, name: str) -> Optional[int]:
         row = conn.execute(
@@ -672,46 +1040,98 @@ class ETVDb:
         new_id = conn.execute("SELECT last_insert_rowid() AS id").fetchone()["id"]
         return int(new_id)
 
-    def get_collection_media_ids(self, conn: sqlite3.Connection, s: Schema, collection_id: int) -> Set[int]:
-        rows = conn.execute(
-            f"SELECT {s.join_media_id_col} AS mid FROM {s.join_table} WHERE {s.join_collection_id_col}=?",
-            (collection_id,),
-        ).fetchall()
-        return {int(r["mid"]) for r in rows if r["mid"] is not None}
-
-    def apply_membership(self, conn: sqlite3.Connection, s: Schema, collection_id: int, desired_media_ids: Set[int], dry_run: bool) -> Tuple[int, int]:
-        current = self.get_collection_media_ids(conn, s, collection_id)
-        to_add = sorted(desired_media_ids - current)
-        to_remove = sorted(current - desired_media_ids)
-        if dry_run:
-            return (len(to_add), len(to_remove))
-
-        if to_remove:
-            ph = ",".join(["?"] * len(to_remove))
-            conn.execute(
-                f"DELETE FROM {s.join_table} WHERE {s.join_collection_id_col}=? AND {s.join_media_id_col} IN ({ph})",
-                [collection_id, *to_remove],
+    def get_collection_ids(self, conn: sqlite3.Connection, s: Schema, names: Sequence[str]) -> Dict[str, int]:
+        out: Dict[str, int] = {}
+        for chunk in chunked(list(names), 400):
+            ph = ",".join(["?"] * len(chunk))
+            rows = conn.execute(
+                f"SELECT {s.collection_name_col} AS name, {s.collection_id_col} AS id FROM {s.collection_table} "
+                f"WHERE {s.collection_name_col} IN ({ph})",
+                list(chunk),
+            ).fetchall()
+            for r in rows:
+                out.setdefault(str(r["name"]), int(r["id"]))
+        return out
+
+    def get_collections_media_ids(self, conn: sqlite3.Connection, s: Schema, collection_ids: Sequence[int]) -> Dict[int, Set[int]]:
+        out: Dict[int, Set[int]] = {int(cid): set() for cid in collection_ids}
+        for chunk in chunked(list(out.keys()), 400):
+            ph = ",".join(["?"] * len(chunk))
+            rows = conn.execute(
+                f"SELECT {s.join_collection_id_col} AS cid, {s.join_media_id_col} AS mid FROM {s.join_table} "
+                f"WHERE {s.join_collection_id_col} IN ({ph})",
+                list(chunk),
+            ).fetchall()
+            for r in rows:
+                if r["mid"] is not None:
+                    out[int(r["cid"])].add(int(r["mid"]))
+        return out
+
+    def existing_media_ids(self, conn: sqlite3.Connection, s: Schema, media_ids: Iterable[int]) -> Set[int]:
+        out: Set[int] = set()
+        for chunk in chunked(sorted(set(media_ids)), 400):
+            ph = ",".join(["?"] * len(chunk))
+            rows = conn.execute(
+                f"SELECT {s.media_pk_col} AS id FROM {s.media_table} WHERE {s.media_pk_col} IN ({ph})",
+                list(chunk),
+            ).fetchall()
+            out.update(int(r["id"]) for r in rows)
+        return out
+
+    def apply_membership_batch(self, conn: sqlite3.Connection, s: Schema, plans: Sequence[CollectionPlan]) -> None:
+        """
+        Write the membership diff of many collections at once (caller holds the write lock).
+
+        Current membership is re-read in bulk under the lock, so the diff is exact even if the plan was built
+        before BEGIN IMMEDIATE. All removes go through one executemany DELETE and all adds through one
+        executemany INSERT; each plan's to_add/to_remove is updated to what was actually written.
+
+        Pinned plans (--apply-plan) may name MediaItems that ErsatzTV removed since the plan was made; those adds
+        are dropped here, since INSERT OR IGNORE does not cover FOREIGN KEY failures.
+        """
+        plans = [p for p in plans if p.collection_id is not None]
+        current = self.get_collections_media_ids(conn, s, [int(p.collection_id) for p in plans])
+        for p in plans:
+            p.diff_against(current[int(p.collection_id)])
+
+        pinned = [p for p in plans if p.pinned and p.to_add]
+        if pinned:
+            alive = self.existing_media_ids(conn, s, (mid for p in pinned for mid in p.to_add))
+            for p in pinned:
+                gone = [mid for mid in p.to_add if mid not in alive]
+                if gone:
+                    log(f"[WARN] '{p.name}': {len(gone)} planned MediaItemId(s) no longer exist in ErsatzTV; skipped")
+                    p.to_add = [mid for mid in p.to_add if mid in alive]
+
+        removes = [(p.collection_id, mid) for p in plans for mid in p.to_remove]
+        if removes:
+            conn.executemany(
+                f"DELETE FROM {s.join_table} WHERE {s.join_collection_id_col}=? AND {s.join_media_id_col}=?",
+                removes,
             )
 
-        if to_add:
-            if s.join_order_col:
-                row = conn.execute(
-                    f"SELECT MAX({s.join_order_col}) AS m FROM {s.join_table} WHERE {s.join_collection_id_col}=?",
-                    (collection_id,),
-                ).fetchone()
-                start = int(row["m"] or 0) + 1
-                for i, mid in enumerate(to_add):
-                    conn.execute(
-                        f"INSERT OR IGNORE INTO {s.join_table} ({s.join_collection_id_col},{s.join_media_id_col},{s.join_order_col}) VALUES (?,?,?)",
-                        (collection_id, mid, start + i),
-                    )
-            else:
-                for mid in to_add:
-                    conn.execute(
-                        f"INSERT OR IGNORE INTO {s.join_table} ({s.join_collection_id_col},{s.join_media_id_col}) VALUES (?,?)",
-                        (collection_id, mid),
-                    )
-        return (len(to_add), len(to_remove))
+        if s.join_order_col:
+            # Next order value per collection, fetched in one grouped query.
+            starts: Dict[int, int] = {}
+            for chunk in chunked([int(p.collection_id) for p in plans if p.to_add], 400):
+                ph = ",".join(["?"] * len(chunk))
+                rows = conn.execute(
+                    f"SELECT {s.join_collection_id_col} AS cid, MAX({s.join_order_col}) AS m FROM {s.join_table} "
+                    f"WHERE {s.join_collection_id_col} IN ({ph}) GROUP BY {s.join_collection_id_col}",
+                    list(chunk),
+                ).fetchall()
+                starts.update({int(r["cid"]): int(r["m"] or 0) for r in rows})
+            adds = [
+                (p.collection_id, mid, starts.get(int(p.collection_id), 0) + 1 + i)
+                for p in plans for i, mid in enumerate(p.to_add)
+            ]
+            sql = (f"INSERT OR IGNORE INTO {s.join_table} "
+                   f"({s.join_collection_id_col},{s.join_media_id_col},{s.join_order_col}) VALUES (?,?,?)")
+        else:
+            adds = [(p.collection_id, mid) for p in plans for mid in p.to_add]
+            sql = f"INSERT OR IGNORE INTO {s.join_table} ({s.join_collection_id_col},{s.join_media_id_col}) VALUES (?,?)"
+        if adds:
+            conn.executemany(sql, adds)
 
     def delete_collection(self, conn: sqlite3.Connection, s: Schema, collection_id: int) -> bool:
         """Best-effort delete. Returns True if deleted, False if blocked by FK constraints."""
@@ -727,6 +1147,154 @@ class ETVDb:
             return False
 
 
+# ============================================================
+# Backups
+# ============================================================
+
+BACKUP_PREFIX = "ersatztv.sqlite3.bak_"
+
+
+def make_backup(etv: ETVDb, conn: sqlite3.Connection, backup_dir: Path, method: str, pages: int, pause_s: float,
+                max_s: float = 120.0) -> Path:
+    backup_dir.mkdir(parents=True, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    backup_path = backup_dir / f"{BACKUP_PREFIX}{stamp}"
+
+    log(f"Backup method: {method}")
+    if method == "copy":
+        log(f"Creating backup via file copy: {backup_path}")
+        etv.backup_copy_file(backup_path)
+        log("Backup OK (file copy).")
+        return backup_path
+
+    label = "VACUUM INTO" if method == "vacuum" else "online backup API"
+    try:
+        log(f"Creating backup via {label}: {backup_path}")
+        t0 = time.monotonic()
+        if method == "vacuum":
+            etv.backup_vacuum_into(conn, backup_path)
+        else:
+            etv.backup_online(conn, backup_path, pages=pages, pause_s=pause_s, max_s=max_s)
+        log(f"Backup OK ({label}, {time.monotonic() - t0:.1f}s).")
+    except Exception as e:
+        if method != "auto":
+            raise RuntimeError(f"{label} failed: {e}") from e
+        log(f"{label} failed ({e}); falling back to file copy...")
+        etv.backup_copy_file(backup_path)
+        log("Backup OK (file copy).")
+    return backup_path
+
+
+def prune_backups(backup_dir: Path, keep: int) -> List[Path]:
+    """Keep the `keep` newest backups (timestamped names sort chronologically); return the removed ones."""
+    if keep <= 0 or not backup_dir.is_dir():
+        return []
+    backups = sorted(p for p in backup_dir.glob(f"{BACKUP_PREFIX}*") if p.is_file() and not p.name.endswith(".part"))
+    removed: List[Path] = []
+    for old in backups[:-keep]:
+        try:
+            old.unlink()
+            removed.append(old)
+        except OSError as e:
+            log(f"[WARN] Could not prune backup {old}: {e}")
+    return removed
+
+
+# ============================================================
+# Plan files (--plan-out / --apply-plan)
+# ============================================================
+
+PLAN_VERSION = 1
+
+
+def plan_to_doc(
+    db_path: Path,
+    schema_fp: str,
+    plans: Sequence[CollectionPlan],
+    delete_plan: Sequence[Tuple[str, int]],
+    absent_names: Sequence[str],
+    boxsets: Dict[str, Dict[str, Any]],
+    listed_ids: Set[str],
+) -> Dict[str, Any]:
+    """Everything --apply-plan needs to write the DB and update the state file without asking Jellyfin."""
+    return {
+        "version": PLAN_VERSION,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "etv_db": str(db_path),
+        "schema_fingerprint": schema_fp,
+        "collections": [
+            {
+                "name": p.name,
+                "id": p.collection_id,
+                "add": p.to_add,
+                "remove": p.to_remove,
+                "desired": len(p.desired),
+                "missing": p.missing_paths,
+            }
+            for p in plans
+        ],
+        "delete": [{"name": name, "id": cid} for name, cid in delete_plan],
+        "absent": list(absent_names),
+        "boxsets": boxsets,
+        "listed_ids": sorted(listed_ids),
+    }
+
+
+def write_plan_file(path: Path, doc: Dict[str, Any]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(json.dumps(doc, ensure_ascii=False, separators=(",", ":")), encoding="utf-8")
+    tmp.replace(path)
+
+
+def read_plan_file(path: Path) -> Dict[str, Any]:
+    if not path.exists():
+        raise FileNotFoundError(f"Plan file not found: {path}")
+    doc = json.loads(path.read_text(encoding="utf-8"))
+    if not isinstance(doc, dict) or doc.get("version") != PLAN_VERSION:
+        raise RuntimeError(f"Unsupported plan file {path} (version={doc.get('version') if isinstance(doc, dict) else None}, "
+                           f"expected {PLAN_VERSION})")
+    for key in ("schema_fingerprint", "collections", "delete", "absent", "boxsets", "listed_ids"):
+        if key not in doc:
+            raise RuntimeError(f"Plan file {path} is missing '{key}'")
+    return doc
+
+
+def plans_from_doc(
+    doc: Dict[str, Any],
+    existing_ids: Dict[str, int],
+    delete_missing: bool = True,
+) -> Tuple[List[CollectionPlan], List[Tuple[str, int]], List[str]]:
+    """
+    Rebuild pinned CollectionPlans and the delete list from a plan file.
+
+    Collection ids are looked up again by name (existing_ids); the id recorded in the plan is only a fallback
+    for deletes, like the state file id is during a normal run. With delete_missing=False
+    (--no-delete-missing-collections at apply time) the plan's deletes are ignored.
+    """
+    plans = [
+        CollectionPlan(
+            name=c["name"],
+            collection_id=existing_ids.get(c["name"]),
+            desired=set(),
+            missing_paths=list(c.get("missing") or []),
+            to_add=[int(x) for x in c.get("add") or []],
+            to_remove=[int(x) for x in c.get("remove") or []],
+            pinned=True,
+        )
+        for c in doc["collections"]
+    ]
+    delete_plan: List[Tuple[str, int]] = []
+    absent_names: List[str] = list(doc["absent"]) if delete_missing else []
+    for d in (doc["delete"] if delete_missing else []):
+        cid = existing_ids.get(d["name"], d.get("id"))
+        if cid is None:
+            absent_names.append(d["name"])
+        else:
+            delete_plan.append((d["name"], int(cid)))
+    return plans, delete_plan, absent_names
+
+
 # ============================================================
 # CLI / Main
 # ============================================================
@@ -739,6 +1307,10 @@ def build_parser() -> argparse.ArgumentParser:
     ap.add_argument("--jellyfin-url", default=os.getenv("JELLYFIN_URL", DEFAULT_JELLYFIN_URL))
     ap.add_argument("--jellyfin-api-key", default=os.getenv("JELLYFIN_API_KEY", DEFAULT_JELLYFIN_API_KEY))
     ap.add_argument("--jellyfin-user-id", default=os.getenv("JELLYFIN_USER_ID", ""))
+    ap.add_argument("--jf-strategy", choices=["boxset", "inventory"], default=os.getenv("JF_STRATEGY", "boxset"),
+                    help="boxset: one recursive query per BoxSet; inventory: one library scan + id-only BoxSet listings")
+    ap.add_argument("--jf-concurrency", type=int, default=int(os.getenv("JF_CONCURRENCY", "4")),
+                    help="Parallel BoxSet child fetches against Jellyfin (1 = sequential)")
 
     ap.add_argument("--etv-db", default=os.getenv("ETV_DB", DEFAULT_ETV_DB))
 
@@ -757,24 +1329,55 @@ def build_parser() -> argparse.ArgumentParser:
     ap.add_argument("--no-adopt-existing", action="store_true", help="Do not add pre-existing ETV collections to managed state automatically")
 
     ap.add_argument("--state-file", default=os.getenv("STATE_FILE", ""), help="Path to state JSON (defaults next to script)")
+
+    # Incremental sync (BoxSet fingerprints stored in the state file)
+    ap.add_argument("--incremental", action="store_true", default=os.getenv("ETV_INCREMENTAL", "") == "1",
+                    help="Only re-fetch/re-diff BoxSets whose fingerprint changed since the last APPLY")
+    ap.add_argument("--incremental-max-age-hours", type=float, default=float(os.getenv("ETV_INCREMENTAL_MAX_AGE_HOURS", "24")),
+                    help="Force a re-sync of a BoxSet whose stored fingerprint is older than this (0 = never)")
     ap.add_argument("--verbose", action="store_true")
     ap.add_argument("--dry-run", action="store_true")
     ap.add_argument("--apply", action="store_true")
+    ap.add_argument("--plan-out", default=os.getenv("ETV_PLAN_OUT", ""),
+                    help="Write the computed plan (per-collection adds/removes + DB schema fingerprint) to this JSON file")
+    ap.add_argument("--apply-plan", default="",
+                    help="Apply a --plan-out file without querying Jellyfin (refused if the DB schema changed since)")
+    ap.add_argument("--plan-max-age-hours", type=float, default=float(os.getenv("ETV_PLAN_MAX_AGE_HOURS", "24")),
+                    help="Refuse --apply-plan files older than this (0 = no limit)")
+
+    ap.add_argument("--no-schema-cache", action="store_true",
+                    help="Always rediscover the ErsatzTV schema instead of reusing the copy cached in the state file")
+    ap.add_argument("--resolve-mode", choices=["chunked", "temp"], default=os.getenv("ETV_RESOLVE_MODE", "chunked"),
+                    help="chunked: IN (...) queries per 400 paths; temp: bulk-load candidates into a TEMP table and resolve with one join")
+
+    # Write transactions vs. ErsatzTV's own scans
+    ap.add_argument("--txn-mode", choices=["per-collection", "batch"], default=os.getenv("ETV_TXN_MODE", "per-collection"),
+                    help="per-collection: one short BEGIN IMMEDIATE per collection; batch: all writes in one transaction")
+    ap.add_argument("--busy-timeout-ms", type=int, default=int(os.getenv("ETV_BUSY_TIMEOUT_MS", "5000")),
+                    help="SQLite busy_timeout per attempt; on SQLITE_BUSY the transaction is retried with backoff")
+    ap.add_argument("--lock-retries", type=int, default=int(os.getenv("ETV_LOCK_RETRIES", "8")))
+    ap.add_argument("--lock-backoff-ms", type=int, default=int(os.getenv("ETV_LOCK_BACKOFF_MS", "500")),
+                    help="Base backoff between lock attempts (exponential, jittered)")
 
     ap.add_argument("--backup-dir", default=os.getenv("ETV_BACKUP_DIR", r"E:\Docker_folders\ersatztv\config\_jf_collection_sync_backups"))
-    ap.add_argument("--backup-method", choices=["auto", "vacuum", "copy"], default=os.getenv("ETV_BACKUP_METHOD", "auto"))
+    ap.add_argument("--backup-method", choices=["auto", "online", "vacuum", "copy"], default=os.getenv("ETV_BACKUP_METHOD", "auto"),
+                    help="auto: online backup API, falling back to file copy")
+    ap.add_argument("--backup-pages", type=int, default=int(os.getenv("ETV_BACKUP_PAGES", "1024")),
+                    help="Pages copied per online backup step")
+    ap.add_argument("--backup-sleep-ms", type=int, default=int(os.getenv("ETV_BACKUP_SLEEP_MS", "50")),
+                    help="Pause between online backup steps")
+    ap.add_argument("--backup-max-seconds", type=float, default=float(os.getenv("ETV_BACKUP_MAX_S", "120")),
+                    help="Give up on the paced online backup after this long (ErsatzTV writes restart it) and "
+                         "redo it in one step (0 = no limit)")
+    ap.add_argument("--backup-keep", type=int, default=int(os.getenv("ETV_BACKUP_KEEP", "0")),
+                    help="Prune --backup-dir down to this many newest backups (0 = keep all, no pruning)")
+    ap.add_argument("--backup-skip-noop", action="store_true", default=os.getenv("ETV_BACKUP_SKIP_NOOP", "") == "1",
+                    help="Skip the backup when the plan has no writes")
 
     ap.add_argument("--max-missing-samples", type=int, default=10)
     return ap
 
 
-def parse_path_map_arg(x: str) -> Tuple[str, str]:
-    if "=>" not in x:
-        raise ValueError(f"Invalid --path-map '{x}'. Expected FROM=>TO")
-    a, b = x.split("=>", 1)
-    return (a, b)
-
-
 def want(name: str, only_re: str, skip_re: str) -> bool:
     if only_re and not re.search(only_re, name, flags=re.IGNORECASE):
         return False
@@ -783,48 +1386,18 @@ def want(name: str, only_re: str, skip_re: str) -> bool:
     return True
 
 
-def main() -> int:
-    args = build_parser().parse_args()
-
-    if not args.jellyfin_api_key:
-        raise RuntimeError("Missing Jellyfin API key")
-
-    dry_run = True
-    if args.apply:
-        dry_run = False
-    elif args.dry_run:
-        dry_run = True
-
-    delete_missing = not args.no_delete_missing_collections
-    adopt_existing = not args.no_adopt_existing
-
-    db_path = Path(args.etv_db)
-    if not db_path.exists():
-        raise FileNotFoundError(f"ErsatzTV DB not found: {db_path}")
-
-    maps: List[Tuple[str, str]] = list(DEFAULT_PATH_MAPS)
-    for pm in args.path_map:
-        maps.append(parse_path_map_arg(pm))
-    enable_maps = not args.no_path_maps
+@dataclass
+class JfScope:
+    """Result of the Jellyfin crawl: collections to diff, collections left alone, and BoxSet state to save."""
+    desired: Dict[str, List[JfItem]] = field(default_factory=dict)
+    unchanged_names: Set[str] = field(default_factory=set)
+    fresh_fps: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    listed_ids: Set[str] = field(default_factory=set)
 
-    state_path = Path(args.state_file) if args.state_file.strip() else default_state_file()
-    state = load_state(state_path)
 
-    hr()
-    log(f"MODE: {'DRY-RUN' if dry_run else 'APPLY'}")
-    log(f"Jellyfin URL: {args.jellyfin_url}")
-    log(f"ErsatzTV DB:  {db_path}")
-    log(f"Prefix/Suffix: '{args.prefix}' / '{args.suffix}'")
-    log(f"Path-maps: {'ENABLED' if enable_maps else 'DISABLED'} (rules={len(maps)})")
-    log(f"Delete missing collections: {'ENABLED' if delete_missing else 'DISABLED'} (managed only)")
-    log(f"Adopt existing collections: {'ENABLED' if adopt_existing else 'DISABLED'}")
-    log(f"State file: {state_path}")
-    if args.verbose and enable_maps:
-        for frm, to in sorted(maps, key=lambda x: len(x[0]), reverse=True):
-            log(f"  map: {frm} => {to}")
-    hr()
-
-    jf = JellyfinClient(args.jellyfin_url, args.jellyfin_api_key)
+def crawl_jellyfin(args: argparse.Namespace, state: Dict[str, Any], maps: List[Tuple[str, str]], enable_maps: bool) -> JfScope:
+    jf_concurrency = max(1, args.jf_concurrency)
+    jf = JellyfinClient(args.jellyfin_url, args.jellyfin_api_key, pool_size=jf_concurrency)
     user_id = jf.pick_user_id(args.jellyfin_user_id)
     log(f"Jellyfin userId: {user_id}")
 
@@ -833,10 +1406,19 @@ def main() -> int:
     hr()
 
     desired: Dict[str, List[JfItem]] = {}
+    unchanged_names: Set[str] = set()
     skipped_empty = 0
     skipped_regex = 0
     total_items = 0
 
+    config_fp = sync_config_fingerprint(maps, enable_maps)
+    stored_fps: Dict[str, Any] = state.get("boxsets", {})
+    fresh_fps: Dict[str, Dict[str, Any]] = {}
+    listed_ids: Set[str] = {str(bs.get("Id")) for bs in boxsets if bs.get("Id")}
+
+    # (etv_name, bs_id, fingerprint, previous state entry, previous entry trusted)
+    to_fetch: List[Tuple[str, str, str, Dict[str, Any], bool]] = []
+
     for bs in boxsets:
         name = (bs.get("Name") or "").strip()
         bs_id = bs.get("Id") or ""
@@ -846,178 +1428,355 @@ def main() -> int:
             skipped_regex += 1
             continue
 
-        items = jf.boxset_playables(user_id, bs_id)
         etv_name = f"{args.prefix}{name}{args.suffix}"
+        fp = boxset_fingerprint(bs)
+        prev = stored_fps.get(etv_name) or {}
+        recent = args.incremental and boxset_entry_is_recent(prev, bs_id, config_fp, args.incremental_max_age_hours)
+
+        if recent and prev.get("fingerprint") == fp:
+            if int(prev.get("items") or 0) == 0 and not args.sync_empty:
+                skipped_empty += 1
+                continue
+            if etv_name in state.get("managed", {}) and int(prev.get("missing") or 0) == 0:
+                unchanged_names.add(etv_name)
+                continue
+
+        to_fetch.append((etv_name, bs_id, fp, prev, recent))
+
+    log(f"Fetching children for {len(to_fetch)} BoxSets (strategy={args.jf_strategy}, concurrency={jf_concurrency})...")
+    fetch_ids = [x[1] for x in to_fetch]
+    if args.jf_strategy == "inventory" and fetch_ids:
+        fetched = jf.boxsets_playables_inventory(user_id, fetch_ids, concurrency=jf_concurrency)
+    else:
+        fetched = jf.boxsets_playables(user_id, fetch_ids, concurrency=jf_concurrency)
+
+    for (etv_name, bs_id, fp, prev, recent), items in zip(to_fetch, fetched):
+        items_fp = items_fingerprint(items)
+        fresh_fps[etv_name] = {
+            "jf_id": bs_id,
+            "fingerprint": fp,
+            "config": config_fp,
+            "items_hash": items_fp,
+            "items": len(items),
+        }
 
         if not items and not args.sync_empty:
             skipped_empty += 1
             continue
 
+        # Fingerprint moved but the playable children did not (e.g. metadata-only edit): nothing to re-diff.
+        if (recent and prev.get("items_hash") == items_fp
+                and etv_name in state.get("managed", {}) and int(prev.get("missing") or 0) == 0):
+            fresh_fps[etv_name]["missing"] = 0
+            unchanged_names.add(etv_name)
+            continue
+
         desired[etv_name] = items
         total_items += len(items)
 
-    desired_names = set(desired.keys())
-
     log(f"Collections to sync: {len(desired)} (skipped_empty={skipped_empty}, skipped_regex={skipped_regex})")
+    if args.incremental:
+        log(f"Collections unchanged since last sync: {len(unchanged_names)}")
     log(f"Total playable items in scope: {total_items}")
     hr()
 
-    etv = ETVDb(db_path)
-    conn = etv.connect()
-    try:
-        schema = etv.discover_schema(conn, verbose=args.verbose)
+    return JfScope(desired=desired, unchanged_names=unchanged_names, fresh_fps=fresh_fps, listed_ids=listed_ids)
+
+
+def plan_collections(
+    etv: ETVDb,
+    conn: sqlite3.Connection,
+    schema: Schema,
+    args: argparse.Namespace,
+    state: Dict[str, Any],
+    mapper: PathMapper,
+    desired: Dict[str, List[JfItem]],
+    desired_names: Set[str],
+    fresh_fps: Dict[str, Dict[str, Any]],
+    delete_missing: bool,
+) -> Tuple[List[CollectionPlan], List[Tuple[str, int]], List[str]]:
+    """Resolve Jellyfin paths to MediaItemIds and diff every collection (read-only; no write lock held)."""
+    per_item_candidates: Dict[str, List[str]] = {}
+    all_candidates: Set[str] = set()
+
+    for items in desired.values():
+        for it in items:
+            cands = mapper.candidates(it.path)
+            per_item_candidates[it.jf_id] = cands
+            for c in cands:
+                all_candidates.add(c)
+
+    log(f"Candidate paths to lookup in ETV DB: {len(all_candidates)} (resolve={args.resolve_mode})")
+    path_to_mid: Dict[str, int] = {}
+    item_to_mid: Dict[str, int] = {}
+    if args.resolve_mode == "temp":
+        item_to_mid = etv.map_items_to_media_ids_temp(conn, schema, per_item_candidates)
+        log(f"Items resolved to MediaItemId: {len(item_to_mid)}/{len(per_item_candidates)}")
+    else:
+        path_to_mid, rows_found = etv.map_paths_to_media_ids(conn, schema, sorted(all_candidates))
+        log(f"Rows found in MediaFile for candidate paths: {rows_found}")
+        log(f"Candidate paths resolved to MediaItemId: {len(path_to_mid)}")
+    hr()
 
-        if not dry_run:
-            backup_dir = Path(args.backup_dir)
-            backup_dir.mkdir(parents=True, exist_ok=True)
-            stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            backup_path = backup_dir / f"ersatztv.sqlite3.bak_{stamp}"
+    # ---- Plan (read-only; no write lock held) ----
+    plans: List[CollectionPlan] = []
+    existing_ids = etv.get_collection_ids(conn, schema, list(desired.keys()))
 
-            log(f"Backup method: {args.backup_method}")
-            if args.backup_method in ("auto", "vacuum"):
-                try:
-                    log(f"Creating backup via VACUUM INTO: {backup_path}")
-                    etv.backup_vacuum_into(conn, backup_path)
-                    log("Backup OK (VACUUM INTO).")
-                except Exception as e:
-                    if args.backup_method == "vacuum":
-                        raise RuntimeError(f"VACUUM INTO failed: {e}") from e
-                    log(f"VACUUM INTO failed ({e}); falling back to file copy...")
-                    etv.backup_copy_file(backup_path)
-                    log("Backup OK (file copy).")
+    for etv_name, items in desired.items():
+        desired_media_ids: Set[int] = set()
+        missing_paths: List[str] = []
+
+        for it in items:
+            mid: Optional[int] = item_to_mid.get(it.jf_id)
+            if mid is None and path_to_mid:
+                for c in per_item_candidates.get(it.jf_id) or [it.path]:
+                    mid = path_to_mid.get(norm_key(c))
+                    if mid is not None:
+                        break
+            if mid is None:
+                missing_paths.append(it.path)
             else:
-                log(f"Creating backup via file copy: {backup_path}")
-                etv.backup_copy_file(backup_path)
-                log("Backup OK (file copy).")
+                desired_media_ids.add(int(mid))
+
+        if etv_name in fresh_fps:
+            fresh_fps[etv_name]["missing"] = len(missing_paths)
+        plans.append(CollectionPlan(
+            name=etv_name,
+            collection_id=existing_ids.get(etv_name),
+            desired=desired_media_ids,
+            missing_paths=missing_paths,
+        ))
+
+    current_by_cid = etv.get_collections_media_ids(conn, schema, [p.collection_id for p in plans if p.collection_id is not None])
+    for p in plans:
+        p.diff_against(current_by_cid.get(p.collection_id, set()) if p.collection_id is not None else set())
+
+    # (name, collection id) of managed collections that disappeared from Jellyfin
+    delete_plan: List[Tuple[str, int]] = []
+    absent_names: List[str] = []
+    if delete_missing:
+        managed = state.get("managed", {})
+        missing_names = sorted([n for n in managed.keys() if n not in desired_names])
+        missing_ids = etv.get_collection_ids(conn, schema, missing_names)
+        for name in missing_names:
+            state_id = managed.get(name, {}).get("id")
+            cid = missing_ids.get(name, state_id if isinstance(state_id, int) else None)
+            if cid is None:
+                absent_names.append(name)
+            else:
+                delete_plan.append((name, int(cid)))
 
-            hr()
-            log("Acquiring write lock (BEGIN IMMEDIATE)...")
-            conn.execute("BEGIN IMMEDIATE;")
-            log("Write lock acquired.")
-            hr()
+    return plans, delete_plan, absent_names
 
-        per_item_candidates: Dict[str, List[str]] = {}
-        all_candidates: Set[str] = set()
 
-        for items in desired.values():
-            for it in items:
-                cands = candidate_paths(it.path, maps, enable_maps)
-                per_item_candidates[it.jf_id] = cands
-                for c in cands:
-                    all_candidates.add(c)
+def main() -> int:
+    args = build_parser().parse_args()
 
-        log(f"Candidate paths to lookup in ETV DB: {len(all_candidates)}")
-        path_to_mid, rows_found = etv.map_paths_to_media_ids(conn, schema, sorted(all_candidates))
-        log(f"Rows found in MediaFile for candidate paths: {rows_found}")
-        log(f"Candidate paths resolved to MediaItemId: {len(path_to_mid)}")
+    if args.apply_plan and args.plan_out:
+        raise RuntimeError("--plan-out and --apply-plan are mutually exclusive")
+    if not args.apply_plan and not args.jellyfin_api_key:
+        raise RuntimeError("Missing Jellyfin API key")
+
+    dry_run = True
+    if args.apply:
+        dry_run = False
+    elif args.dry_run:
+        dry_run = True
+    elif args.apply_plan:
+        dry_run = False
+
+    delete_missing = not args.no_delete_missing_collections
+    adopt_existing = not args.no_adopt_existing
+
+    db_path = Path(args.etv_db)
+    if not db_path.exists():
+        raise FileNotFoundError(f"ErsatzTV DB not found: {db_path}")
+
+    maps: List[Tuple[str, str]] = list(DEFAULT_PATH_MAPS)
+    for pm in args.path_map:
+        maps.append(parse_rule(pm))
+    enable_maps = not args.no_path_maps
+    mapper = PathMapper(maps if enable_maps else [])
+
+    state_path = Path(args.state_file) if args.state_file.strip() else default_state_file()
+    state = load_state(state_path)
+
+    hr()
+    log(f"MODE: {'DRY-RUN' if dry_run else 'APPLY'}")
+    log(f"Jellyfin URL: {args.jellyfin_url} (concurrency={max(1, args.jf_concurrency)})")
+    log(f"ErsatzTV DB:  {db_path}")
+    log(f"Prefix/Suffix: '{args.prefix}' / '{args.suffix}'")
+    log(f"Path-maps: {'ENABLED' if enable_maps else 'DISABLED'} (rules={len(maps)})")
+    log(f"Delete missing collections: {'ENABLED' if delete_missing else 'DISABLED'} (managed only)")
+    log(f"Adopt existing collections: {'ENABLED' if adopt_existing else 'DISABLED'}")
+    log(f"State file: {state_path}")
+    log(f"Incremental: {'ENABLED' if args.incremental else 'DISABLED'} (max_age={args.incremental_max_age_hours}h)")
+    if args.plan_out:
+        log(f"Plan out: {args.plan_out}")
+    if args.verbose and enable_maps:
+        for frm, to in sorted(maps, key=lambda x: len(x[0]), reverse=True):
+            log(f"  map: {frm} => {to}")
+    hr()
+
+    plan_doc: Optional[Dict[str, Any]] = None
+    if args.apply_plan:
+        plan_doc = read_plan_file(Path(args.apply_plan))
+        scope = JfScope(fresh_fps=plan_doc["boxsets"], listed_ids=set(plan_doc["listed_ids"]))
+        log(f"Plan file: {args.apply_plan} (created {plan_doc.get('created_at')}, "
+            f"collections={len(plan_doc['collections'])}, deletes={len(plan_doc['delete'])}); Jellyfin is not queried")
+        try:
+            plan_age_h = (datetime.now() - datetime.fromisoformat(str(plan_doc.get("created_at")))).total_seconds() / 3600
+        except ValueError:
+            plan_age_h = None
+        if args.plan_max_age_hours > 0 and (plan_age_h is None or plan_age_h > args.plan_max_age_hours):
+            age = "unknown" if plan_age_h is None else f"{plan_age_h:.1f}h"
+            raise RuntimeError(f"Plan file is too old (age={age}, --plan-max-age-hours={args.plan_max_age_hours:g}). "
+                               f"Re-run the dry-run.")
+        if plan_doc.get("etv_db") and Path(plan_doc["etv_db"]) != db_path:
+            log(f"[WARN] Plan was computed against a different DB path: {plan_doc['etv_db']}")
         hr()
+    else:
+        scope = crawl_jellyfin(args, state, maps, enable_maps)
+    desired = scope.desired
+    fresh_fps = scope.fresh_fps
+    desired_names = set(desired.keys()) | scope.unchanged_names
+
+    etv = ETVDb(db_path, busy_timeout_ms=args.busy_timeout_ms)
+    conn = etv.connect()
+    try:
+        if plan_doc is not None:
+            live_fp = etv.schema_fingerprint(conn)
+            if live_fp != plan_doc["schema_fingerprint"]:
+                raise RuntimeError(f"ErsatzTV DB schema changed since the plan was made "
+                                   f"(plan={plan_doc['schema_fingerprint']}, db={live_fp}). Re-run the dry-run.")
+
+        schema_cache = state.setdefault("schema_cache", {})
+        schema_fp_before = schema_cache.get("fingerprint")
+        schema = etv.load_schema(conn, schema_cache, verbose=args.verbose, use_cache=not args.no_schema_cache)
+
+        if plan_doc is not None:
+            names = [c["name"] for c in plan_doc["collections"]] + [d["name"] for d in plan_doc["delete"]]
+            plans, delete_plan, absent_names = plans_from_doc(plan_doc, etv.get_collection_ids(conn, schema, names),
+                                                              delete_missing)
+        else:
+            plans, delete_plan, absent_names = plan_collections(
+                etv, conn, schema, args, state, mapper, desired, desired_names, fresh_fps, delete_missing
+            )
+            if args.plan_out:
+                doc = plan_to_doc(db_path, etv.schema_fingerprint(conn), plans, delete_plan, absent_names,
+                                  fresh_fps, scope.listed_ids)
+                write_plan_file(Path(args.plan_out), doc)
+                log(f"Plan written: {args.plan_out} (schema={doc['schema_fingerprint']})")
 
         total_created = 0
         total_add = 0
         total_remove = 0
-        total_missing = 0
+        total_missing = sum(len(p.missing_paths) for p in plans)
+        deleted_count = 0
+        blocked_count = 0
+        deleted: Dict[str, bool] = {}
 
-        managed_now: Dict[str, int] = {}
+        # ---- Apply (short write transactions) ----
+        lock_stats = LockStats()
+        if not dry_run:
+            planned_writes = (sum(len(p.to_add) + len(p.to_remove) + (p.collection_id is None) for p in plans)
+                              + len(delete_plan))
+            if planned_writes == 0 and args.backup_skip_noop:
+                log("Plan has no writes; skipping backup.")
+            else:
+                backup_dir = Path(args.backup_dir)
+                make_backup(etv, conn, backup_dir, args.backup_method, args.backup_pages, args.backup_sleep_ms / 1000,
+                            args.backup_max_seconds)
+                for old in prune_backups(backup_dir, args.backup_keep):
+                    log(f"Pruned old backup: {old.name}")
 
-        for etv_name, items in desired.items():
-            cid = etv.get_collection_id(conn, schema, etv_name)
-            created_now = False
+            hr()
 
-            if cid is None:
-                if dry_run:
-                    log(f"[PLAN] Would CREATE collection: '{etv_name}'")
-                    cid = -1
-                else:
-                    cid = etv.create_collection(conn, schema, etv_name)
-                    created_now = True
-                    total_created += 1
-                    log(f"[OK] Created collection '{etv_name}' (id={cid})")
+            def write_collection(p: CollectionPlan, orig_id: Optional[int]) -> bool:
+                # Re-runnable on retry: restore the pre-transaction id before (re)creating.
+                p.collection_id = orig_id
+                created = False
+                if p.collection_id is None:
+                    p.collection_id = etv.create_collection(conn, schema, p.name)
+                    created = True
+                etv.apply_membership_batch(conn, schema, [p])
+                return created
 
-            desired_media_ids: Set[int] = set()
-            missing_paths: List[str] = []
+            def txn(fn) -> Any:
+                return etv.write_txn(conn, fn, lock_stats, retries=args.lock_retries, backoff_s=args.lock_backoff_ms / 1000)
 
-            for it in items:
-                cands = per_item_candidates.get(it.jf_id) or [it.path]
-                mid: Optional[int] = None
-                for c in cands:
-                    mid = path_to_mid.get(norm_key(c))
-                    if mid is not None:
-                        break
-                if mid is None:
-                    missing_paths.append(it.path)
-                else:
-                    desired_media_ids.add(int(mid))
+            if args.txn_mode == "batch":
+                orig_ids = [p.collection_id for p in plans]
 
-            total_missing += len(missing_paths)
+                def write_all() -> Tuple[List[bool], Dict[str, bool]]:
+                    created = [write_collection(p, cid) for p, cid in zip(plans, orig_ids)]
+                    return created, {name: etv.delete_collection(conn, schema, cid) for name, cid in delete_plan}
 
-            if dry_run and cid == -1:
-                add_n = len(desired_media_ids)
-                rem_n = 0
-                total_add += add_n
-                log(f"[PLAN] '{etv_name}': +{add_n} / -{rem_n} (desired={len(desired_media_ids)} missing={len(missing_paths)})")
+                log("Writing all collections in one transaction (BEGIN IMMEDIATE)...")
+                created_flags, deleted = txn(write_all)
             else:
-                add_n, rem_n = etv.apply_membership(conn, schema, cid, desired_media_ids, dry_run=dry_run)
-                total_add += add_n
-                total_remove += rem_n
-                tag = "[PLAN]" if dry_run else "[OK]"
-                log(f"{tag} '{etv_name}': +{add_n} / -{rem_n} (desired={len(desired_media_ids)} missing={len(missing_paths)})")
-
-                if not dry_run and cid is not None and cid >= 0:
-                    managed_now[etv_name] = int(cid)
-
-            if args.verbose and missing_paths:
-                for p in missing_paths[: args.max_missing_samples]:
-                    log(f"      missing: {p}")
-                if len(missing_paths) > args.max_missing_samples:
-                    log(f"      ... +{len(missing_paths) - args.max_missing_samples} more")
+                log("Writing one transaction per collection (BEGIN IMMEDIATE)...")
+                created_flags = []
+                for p in plans:
+                    if p.collection_id is not None and not p.to_add and not p.to_remove:
+                        created_flags.append(False)
+                        continue
+                    orig_id = p.collection_id
+                    created_flags.append(txn(lambda: write_collection(p, orig_id)))
+                for name, cid in delete_plan:
+                    deleted[name] = txn(lambda: etv.delete_collection(conn, schema, cid))
 
-            if created_now and args.verbose and not dry_run:
-                log("      created new collection row in DB")
+            for p, created in zip(plans, created_flags):
+                if created:
+                    total_created += 1
+                    log(f"[OK] Created collection '{p.name}' (id={p.collection_id})")
+            for name, ok in deleted.items():
+                if ok:
+                    deleted_count += 1
+                    state["managed"].pop(name, None)
+                else:
+                    blocked_count += 1
+
+            log(f"COMMIT OK. Write lock: {lock_stats.summary()}")
+
+        # ---- Report ----
+        for p in plans:
+            if dry_run and p.collection_id is None:
+                log(f"[PLAN] Would CREATE collection: '{p.name}'")
+            tag = "[PLAN]" if dry_run else "[OK]"
+            desired_info = "" if p.pinned else f"desired={len(p.desired)} "
+            log(f"{tag} '{p.name}': +{len(p.to_add)} / -{len(p.to_remove)} ({desired_info}missing={len(p.missing_paths)})")
+            total_add += len(p.to_add)
+            total_remove += len(p.to_remove)
+
+            if args.verbose and p.missing_paths:
+                for mp in p.missing_paths[: args.max_missing_samples]:
+                    log(f"      missing: {mp}")
+                if len(p.missing_paths) > args.max_missing_samples:
+                    log(f"      ... +{len(p.missing_paths) - args.max_missing_samples} more")
 
         if not dry_run:
-            for name, cid in managed_now.items():
-                if adopt_existing or name in state.get("managed", {}) or cid is not None:
-                    state["managed"][name] = {
-                        "id": cid,
+            for p in plans:
+                if adopt_existing or p.name in state.get("managed", {}) or p.collection_id is not None:
+                    state["managed"][p.name] = {
+                        "id": p.collection_id,
                         "last_seen": datetime.now().isoformat(timespec="seconds"),
                     }
 
-        deleted_count = 0
-        blocked_count = 0
-
         if delete_missing:
-            managed = state.get("managed", {})
-            missing_names = sorted([n for n in managed.keys() if n not in desired_names])
-
-            if missing_names:
+            if delete_plan or absent_names:
                 hr()
-                log(f"Managed collections missing in Jellyfin: {len(missing_names)}")
-                for name in missing_names:
-                    state_id = managed.get(name, {}).get("id")
-                    cid = None
-                    if isinstance(state_id, int):
-                        cid = state_id
-                    cid_by_name = etv.get_collection_id(conn, schema, name)
-                    if cid_by_name is not None:
-                        cid = cid_by_name
-
-                    if cid is None:
-                        log(f"[OK] Collection '{name}' already absent in ErsatzTV; removing from state")
-                        if not dry_run:
-                            state["managed"].pop(name, None)
-                        continue
-
+                log(f"Managed collections missing in Jellyfin: {len(delete_plan) + len(absent_names)}")
+                for name in absent_names:
+                    log(f"[OK] Collection '{name}' already absent in ErsatzTV; removing from state")
+                    if not dry_run:
+                        state["managed"].pop(name, None)
+                for name, cid in delete_plan:
                     if dry_run:
                         log(f"[PLAN] Would DELETE collection '{name}' (id={cid})")
-                        continue
-
-                    ok = etv.delete_collection(conn, schema, int(cid))
-                    if ok:
-                        deleted_count += 1
+                    elif deleted.get(name):
                         log(f"[OK] Deleted collection '{name}' (id={cid})")
-                        state["managed"].pop(name, None)
                     else:
-                        blocked_count += 1
                         log(f"[WARN] Could NOT delete '{name}' (id={cid}) due to foreign key references (e.g., schedules). Skipping.")
             else:
                 if args.verbose:
@@ -1025,15 +1784,28 @@ def main() -> int:
                     log("No managed collections are missing in Jellyfin. Nothing to delete.")
 
         if not dry_run:
-            conn.commit()
-            log("COMMIT OK.")
+            # Fingerprints from a plan file are as old as the crawl that produced them, not this run.
+            synced_at = str(plan_doc.get("created_at") or "") if plan_doc is not None else datetime.now().isoformat(timespec="seconds")
+            for name, entry in fresh_fps.items():
+                entry["synced_at"] = synced_at
+                state["boxsets"][name] = entry
+            # Forget fingerprints of BoxSets that are gone from Jellyfin.
+            for name in [n for n, e in state["boxsets"].items() if not isinstance(e, dict) or e.get("jf_id") not in scope.listed_ids]:
+                state["boxsets"].pop(name, None)
+
             save_state(state_path, state)
             log(f"State saved: {state_path}")
+        elif schema_cache.get("fingerprint") != schema_fp_before:
+            # Dry-runs leave managed/boxset state alone, but a freshly discovered schema is worth keeping.
+            save_state(state_path, state)
+            log(f"Schema cache saved: {state_path}")
 
         hr()
         log("SUMMARY")
         log(f"  mode:            {'DRY-RUN' if dry_run else 'APPLY'}")
-        log(f"  collections:     {len(desired)}")
+        log(f"  collections:     {len(plans)}")
+        if args.incremental:
+            log(f"  unchanged:       {len(scope.unchanged_names)}")
         log(f"  created:         {total_created}")
         log(f"  adds:            {total_add}")
         log(f"  removes:         {total_remove}")
@@ -1041,6 +1813,8 @@ def main() -> int:
         if delete_missing:
             log(f"  deleted missing: {deleted_count}")
             log(f"  delete blocked:  {blocked_count}")
+        if not dry_run:
+            log(f"  write lock:      {lock_stats.summary()}")
         hr()
 
         return 0
@@ -0,0 +1,357 @@
+"""
+Replay / benchmark harness for the watchdog state machine (VpnSupervisor) without a Docker daemon.
+
+A FakeDocker answers the DockerAPI calls the supervisor makes from an in-memory model of the VPN and its
+dependents. A scenario is a timeline of faults applied on a virtual clock:
+
+    {"name": "vpn-recreate", "duration": 900, "config": {"down_grace": 120},
+     "timeline": [{"t": 63, "vpn": "recreate"}]}
+
+Faults: "unhealthy", "healthy", "exited", "running", "restart" (same id, new StartedAt) and "recreate"
+(new id; dependents die still pointing at the old netns). Per scenario it reports how long the watchdog
+took to notice each fault, how long until everything was running again in the right netns, and how many
+Docker actions it took. Docker calls take no virtual time, so "recover" is the watchdog's own delay.
+
+    python simulate.py                                  # built-in scenarios
+    python simulate.py --check-interval 5 --down-grace 60 --cooldown 60
+    python simulate.py --scenario my-timeline.json --events --verbose
+"""
+
+import argparse
+import datetime as dt
+import json
+import re
+import sys
+import threading
+from collections import Counter
+
+import watchdog as wd
+
+
+BUILTIN_SCENARIOS = [
+    {
+        "name": "vpn-flap",
+        "duration": 1200,
+        "timeline": [
+            {"t": 63, "vpn": "unhealthy"},
+            {"t": 104, "vpn": "healthy"},
+            {"t": 307, "vpn": "unhealthy"},
+            {"t": 702, "vpn": "healthy"},
+        ],
+    },
+    {"name": "vpn-exit", "duration": 900, "timeline": [{"t": 63, "vpn": "exited"}, {"t": 404, "vpn": "running"}]},
+    {"name": "vpn-restart", "duration": 600, "timeline": [{"t": 63, "vpn": "restart"}]},
+    {"name": "vpn-recreate", "duration": 600, "timeline": [{"t": 63, "vpn": "recreate"}]},
+    {
+        "name": "netns-error",
+        "duration": 600,
+        "config": {"recreate_on_netns_mismatch": False},
+        "timeline": [{"t": 63, "vpn": "recreate"}],
+    },
+    {
+        "name": "double-recreate",
+        "duration": 900,
+        "timeline": [{"t": 63, "vpn": "recreate"}, {"t": 131, "vpn": "recreate"}],
+    },
+]
+
+
+class VirtualClock:
+    def __init__(self, start: float = 1_700_000_000.0):
+        self.now = start
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _rfc3339(ts: float) -> str:
+    return dt.datetime.fromtimestamp(ts, dt.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+class FakeDocker:
+    """In-memory daemon with the DockerAPI methods VpnSupervisor uses. Every mutating call is counted."""
+
+    def __init__(self, clock: VirtualClock, vpn: str, dependents: list[str]):
+        self.clock = clock
+        self.vpn = vpn
+        self.lock = threading.Lock()
+        self.actions: Counter = Counter()
+        self._seq = 0
+        self.containers: dict[str, dict] = {}
+        self._add(vpn, network_mode="default", health="healthy")
+        vpn_id = self.containers[vpn]["Id"]
+        for name in dependents:
+            self._add(name, network_mode=f"container:{vpn_id}")
+
+    def _new_id(self) -> str:
+        self._seq += 1
+        return f"{self._seq:064x}"
+
+    def _add(self, name: str, network_mode: str, health: str | None = None, status: str = "running") -> dict:
+        c = {
+            "Id": self._new_id(),
+            "Status": status,
+            "Health": health,
+            "StartedAt": _rfc3339(self.clock()),
+            "FinishedAt": "0001-01-01T00:00:00Z",
+            "RestartCount": 0,
+            "NetworkMode": network_mode,
+            "Image": f"example/{name}:latest",
+        }
+        self.containers[name] = c
+        return c
+
+    def _get(self, name_or_id: str) -> tuple[str, dict]:
+        for name, c in self.containers.items():
+            if name_or_id in (name, c["Id"]):
+                return name, c
+        raise RuntimeError(f"404: No such container: {name_or_id}")
+
+    def _run(self, name: str, c: dict) -> None:
+        mode = c["NetworkMode"]
+        if mode.startswith("container:"):
+            target = mode.split(":", 1)[1]
+            owner = next((o for o in self.containers.values() if o["Id"] == target), None)
+            if owner is None:
+                raise RuntimeError(f"500: joining network namespace of container: No such container: {target}")
+            if owner["Status"] != "running":
+                raise RuntimeError(f"409: cannot join network of a non running container: {target}")
+        c["Status"] = "running"
+        c["StartedAt"] = _rfc3339(self.clock())
+        c.pop("Stale", None)
+        if name == self.vpn:
+            c["Health"] = "healthy"
+
+    # ---- faults ----
+    def apply(self, fault: str) -> None:
+        with self.lock:
+            vpn = self.containers[self.vpn]
+            now = _rfc3339(self.clock())
+            if fault in ("unhealthy", "healthy"):
+                vpn["Health"] = fault
+            elif fault == "exited":
+                vpn["Status"], vpn["FinishedAt"] = "exited", now
+            elif fault in ("running", "restart"):
+                vpn["Status"], vpn["Health"], vpn["StartedAt"] = "running", "healthy", now
+                if fault == "restart":
+                    vpn["RestartCount"] += 1
+                for name, c in self.containers.items():
+                    if name != self.vpn and c["NetworkMode"] == f"container:{vpn['Id']}":
+                        c["Stale"] = True  # same id, but the namespace they joined is gone
+            elif fault == "recreate":
+                old_id = vpn["Id"]
+                vpn.update(Id=self._new_id(), Status="running", Health="healthy", StartedAt=now, RestartCount=0)
+                for name, c in self.containers.items():
+                    if name != self.vpn and c["NetworkMode"] == f"container:{old_id}":
+                        c["Status"], c["FinishedAt"] = "exited", now
+            else:
+                raise ValueError(f"unknown fault {fault!r}")
+
+    def healthy(self) -> bool:
+        """VPN up and every dependent running, un-stale, in the current VPN namespace."""
+        with self.lock:
+            vpn = self.containers.get(self.vpn)
+            if not vpn or vpn["Status"] != "running" or vpn["Health"] == "unhealthy":
+                return False
+            for name, c in self.containers.items():
+                if name == self.vpn or re.search(r"-wd-old-\d+$", name):
+                    continue
+                if c["Status"] != "running" or c.get("Stale") or c["NetworkMode"] != f"container:{vpn['Id']}":
+                    return False
+            return True
+
+    # ---- DockerAPI surface ----
+    def container_inspect(self, name_or_id: str):
+        with self.lock:
+            name, c = self._get(name_or_id)
+            health = {"Status": c["Health"], "FailingStreak": 0, "Log": []} if c["Health"] else None
+            if c["Health"] == "unhealthy":
+                health["Log"] = [{"ExitCode": 1, "Start": _rfc3339(self.clock()), "End": _rfc3339(self.clock()),
+                                  "Output": "simulated failure"}]
+            return {
+                "Id": c["Id"],
+                "Name": "/" + name,
+                "State": {
+                    "Status": c["Status"],
+                    "Health": health,
+                    "StartedAt": c["StartedAt"],
+                    "FinishedAt": c["FinishedAt"],
+                    "RestartCount": c["RestartCount"],
+                },
+                "Config": {"Image": c["Image"], "Env": [], "Labels": {}},
+                "HostConfig": {"NetworkMode": c["NetworkMode"]},
+            }
+
+    def containers_list(self, filters: dict, all_: bool = True):
+        patterns = [re.compile(p) for p in filters.get("name", [])]
+        with self.lock:
+            return [
+                {"Id": c["Id"], "Names": ["/" + name], "State": c["Status"],
+                 "HostConfig": {"NetworkMode": c["NetworkMode"]}}
+                for name, c in self.containers.items()
+                if not patterns or any(p.search("/" + name) for p in patterns)
+            ]
+
+    def container_restart(self, name_or_id: str, timeout_s: int = 30):
+        with self.lock:
+            self.actions["restart"] += 1
+            name, c = self._get(name_or_id)
+            self._run(name, c)
+
+    def container_start(self, name_or_id: str):
+        with self.lock:
+            self.actions["start"] += 1
+            name, c = self._get(name_or_id)
+            self._run(name, c)
+
+    def container_stop(self, name_or_id: str, timeout_s: int = 20):
+        with self.lock:
+            self.actions["stop"] += 1
+            _, c = self._get(name_or_id)
+            c["Status"], c["FinishedAt"] = "exited", _rfc3339(self.clock())
+
+    def container_rename(self, name_or_id: str, new_name: str):
+        with self.lock:
+            self.actions["rename"] += 1
+            name, c = self._get(name_or_id)
+            self.containers[new_name] = self.containers.pop(name)
+
+    def container_remove(self, name_or_id: str, force: bool = True, volumes: bool = False):
+        with self.lock:
+            self.actions["remove"] += 1
+            name, _ = self._get(name_or_id)
+            del self.containers[name]
+
+    def container_create(self, name: str, payload: dict):
+        with self.lock:
+            self.actions["create"] += 1
+            if name in self.containers:
+                raise RuntimeError(f"409: Conflict. The container name /{name} is already in use")
+            c = self._add(name, network_mode=payload["HostConfig"]["NetworkMode"], status="created")
+            c["Image"] = payload.get("Image") or c["Image"]
+            return _Json({"Id": c["Id"]})
+
+    def container_logs_tail(self, name_or_id: str, tail: int = 60, **kwargs):
+        return ""
+
+    def image_exists(self, image: str) -> bool:
+        return True
+
+    def image_pull(self, image: str):
+        self.actions["pull"] += 1
+
+
+class _Json:
+    def __init__(self, data):
+        self._data = data
+
+    def json(self):
+        return self._data
+
+
+def run_scenario(sc: dict, base: dict, check_interval: int, reconcile_interval: int, events: bool) -> dict:
+    clock = VirtualClock()
+    start = clock.now
+    dependents = sc.get("dependents") or ["app", "app-exporter", "browser"]
+    opts = dict(base)
+    opts.update(sc.get("config") or {})
+    cfg = wd.GroupConfig(name=sc["name"], vpn_container="vpn", dependents=dependents,
+                         depends_on={"app-exporter": ["app"]}, **opts)
+    api = FakeDocker(clock, "vpn", dependents)
+    sup = wd.VpnSupervisor(api, cfg, verbose=False, print_health_logs=False, log_tail=0, action_workers=4,
+                           clock=clock)
+
+    timeline = sorted(sc["timeline"], key=lambda e: e["t"])
+    faults = [{"t": e["t"], "fault": e["vpn"], "detected": None, "recovered": None} for e in timeline]
+    pending = list(faults)
+    t = 0.0
+    ticks = 0
+    was_detecting = False
+
+    while t <= sc["duration"]:
+        clock.now = start + t
+        while pending and pending[0]["t"] <= t:
+            api.apply(pending.pop(0)["fault"])
+        healthy_before = api.healthy()
+
+        idle = sup.tick()
+        ticks += 1
+
+        detecting = sup.detected_at is not None or sup.pending_vpn_restart_since is not None
+        applied = [f for f in faults if f["t"] <= t]
+        if applied:
+            last = applied[-1]
+            if last["detected"] is None and last["fault"] not in ("healthy", "running"):
+                if detecting and not was_detecting:
+                    last["detected"] = t - last["t"]
+            if healthy_before or api.healthy():
+                for f in applied:
+                    if f["recovered"] is None:
+                        f["recovered"] = t - f["t"]
+        was_detecting = detecting
+
+        step = reconcile_interval if (events and idle) else check_interval
+        nxt = t + step
+        if events and pending:
+            nxt = min(nxt, pending[0]["t"])  # the /events stream wakes the loop right away
+        t = max(nxt, t + 1e-3)
+
+    return {"name": sc["name"], "faults": faults, "actions": dict(api.actions), "ticks": ticks,
+            "healthy_at_end": api.healthy()}
+
+
+def _fmt_s(v) -> str:
+    return "-" if v is None else f"{v:.0f}s"
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Replay fault timelines against the watchdog state machine.")
+    ap.add_argument("--scenario", action="append", default=[], help="JSON file with one scenario or a list")
+    ap.add_argument("--check-interval", type=int, default=wd.getenv_int("CHECK_INTERVAL", 10))
+    ap.add_argument("--reconcile-interval", type=int, default=wd.getenv_int("RECONCILE_INTERVAL", 60))
+    ap.add_argument("--down-grace", type=int, default=wd.getenv_int("DOWN_GRACE", 180))
+    ap.add_argument("--cooldown", type=int, default=wd.getenv_int("COOLDOWN", 120))
+    ap.add_argument("--vpn-restart-grace", type=int, default=wd.getenv_int("VPN_RESTART_GRACE", 15))
+    ap.add_argument("--events", action="store_true", help="simulate EVENTS_MODE (tick as soon as a fault happens)")
+    ap.add_argument("--json", action="store_true", help="print raw results as JSON")
+    ap.add_argument("--verbose", action="store_true", help="show the watchdog log lines")
+    args = ap.parse_args()
+
+    if not args.verbose:
+        wd.log = lambda msg: None
+
+    scenarios: list[dict] = []
+    for path in args.scenario:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        scenarios.extend(data if isinstance(data, list) else [data])
+    if not scenarios:
+        scenarios = BUILTIN_SCENARIOS
+
+    base = {
+        "startup_grace": 0,
+        "down_grace": args.down_grace,
+        "cooldown": args.cooldown,
+        "vpn_restart_grace": args.vpn_restart_grace,
+    }
+    results = [run_scenario(sc, base, args.check_interval, args.reconcile_interval, args.events) for sc in scenarios]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+
+    print(f"CHECK_INTERVAL={args.check_interval}s DOWN_GRACE={args.down_grace}s COOLDOWN={args.cooldown}s "
+          f"VPN_RESTART_GRACE={args.vpn_restart_grace}s EVENTS_MODE={int(args.events)}")
+    print(f"{'scenario':<18} {'t':>6} {'fault':<10} {'detect':>7} {'recover':>8}   actions")
+    for r in results:
+        acts = " ".join(f"{k}={v}" for k, v in sorted(r["actions"].items())) or "-"
+        for i, f in enumerate(r["faults"]):
+            print(f"{r['name'] if i == 0 else '':<18} {f['t']:>5}s {f['fault']:<10} {_fmt_s(f['detected']):>7} "
+                  f"{_fmt_s(f['recovered']):>8}   {acts if i == 0 else ''}")
+        if not r["healthy_at_end"]:
+            print(f"{'':<18} !! not healthy at end of run")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,7 +2,14 @@ import os
 import sys
 import time
 import json
+import queue
+import re
+import threading
 import datetime as dt
+from collections import deque
+from dataclasses import dataclass, field, fields
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from urllib.parse import quote
 
 import requests
@@ -12,6 +19,11 @@ try:
 except Exception:
     requests_unixsocket = None
 
+try:
+    import yaml
+except Exception:
+    yaml = None
+
 
 # -------------------------------
 # Utils
@@ -48,6 +60,19 @@ def getenv_bool(name: str, default: bool = False) -> bool:
     return v in ("1", "true", "yes", "y", "on")
 
 
+def parse_depends_on(raw: str) -> dict[str, list[str]]:
+    """DEPENDS_ON="exporter:dispatcharr;b:a,c" -> {"exporter": ["dispatcharr"], "b": ["a", "c"]}"""
+    out: dict[str, list[str]] = {}
+    for part in (raw or "").split(";"):
+        if ":" not in part:
+            continue
+        name, deps = part.split(":", 1)
+        name = name.strip()
+        if name:
+            out.setdefault(name, []).extend(d.strip() for d in deps.split(",") if d.strip())
+    return out
+
+
 def normalize_docker_host(raw: str) -> tuple[str, str]:
     """Return (mode, base_url). mode is 'unix' or 'http'."""
     raw = (raw or "").strip()
@@ -77,6 +102,232 @@ def is_netns_join_error(msg: str) -> bool:
     return ("joining network namespace" in msg) and ("no such container" in msg)
 
 
+_DOCKER_TIME_RE = re.compile(r"^(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d)(\.\d+)?(Z|[+-]\d\d:\d\d)$")
+
+
+def parse_docker_time(s: str | None) -> float | None:
+    """RFC3339 with nanoseconds ("2024-05-01T10:00:00.123456789Z") -> epoch seconds. Zero time -> None."""
+    if not s or s.startswith("0001-"):
+        return None
+    m = _DOCKER_TIME_RE.match(s)
+    if not m:
+        return None
+    base = dt.datetime.fromisoformat(m.group(1) + m.group(3).replace("Z", "+00:00"))
+    return base.timestamp() + (float("0" + m.group(2)) if m.group(2) else 0.0)
+
+
+# -------------------------------
+# Metrics (Prometheus text format)
+# -------------------------------
+
+class Metrics:
+    """
+    Minimal thread-safe registry rendered in the Prometheus text exposition format.
+
+    Served on METRICS_PORT (/metrics) and/or written to METRICS_TEXTFILE for a node-exporter / Netdata
+    textfile collector. No client library needed.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.meta: dict[str, tuple[str, str, tuple]] = {}  # name -> (type, help, buckets)
+        self.values: dict[str, dict[tuple, float]] = {}  # counters/gauges: name -> {labels: value}
+        self.hists: dict[str, dict[tuple, list]] = {}  # name -> {labels: [bucket counts..., sum, count]}
+
+    def describe(self, name: str, mtype: str, help_: str, buckets: tuple = ()) -> None:
+        self.meta[name] = (mtype, help_, tuple(buckets))
+        (self.hists if mtype == "histogram" else self.values).setdefault(name, {})
+
+    @staticmethod
+    def _labels(labels: dict) -> tuple:
+        return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def inc(self, name: str, value: float = 1.0, **labels) -> None:
+        key = self._labels(labels)
+        with self.lock:
+            series = self.values[name]
+            series[key] = series.get(key, 0.0) + value
+
+    def set(self, name: str, value: float, **labels) -> None:
+        with self.lock:
+            self.values[name][self._labels(labels)] = float(value)
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        buckets = self.meta[name][2]
+        key = self._labels(labels)
+        with self.lock:
+            h = self.hists[name].setdefault(key, [0] * len(buckets) + [0.0, 0])
+            for i, b in enumerate(buckets):
+                if value <= b:
+                    h[i] += 1
+            h[-2] += value
+            h[-1] += 1
+
+    @staticmethod
+    def _fmt(labels: tuple, extra: tuple = ()) -> str:
+        items = list(labels) + list(extra)
+        if not items:
+            return ""
+        esc = lambda v: v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in items) + "}"
+
+    def render(self) -> str:
+        out: list[str] = []
+        with self.lock:
+            for name, (mtype, help_, buckets) in self.meta.items():
+                out.append(f"# HELP {name} {help_}")
+                out.append(f"# TYPE {name} {mtype}")
+                if mtype == "histogram":
+                    for labels, h in self.hists[name].items():
+                        for i, b in enumerate(buckets):
+                            out.append(f"{name}_bucket{self._fmt(labels, (('le', repr(float(b))),))} {h[i]}")
+                        out.append(f"{name}_bucket{self._fmt(labels, (('le', '+Inf'),))} {h[-1]}")
+                        out.append(f"{name}_sum{self._fmt(labels)} {h[-2]}")
+                        out.append(f"{name}_count{self._fmt(labels)} {h[-1]}")
+                else:
+                    for labels, v in self.values[name].items():
+                        out.append(f"{name}{self._fmt(labels)} {v}")
+        return "\n".join(out) + "\n"
+
+    def write_textfile(self, path: str) -> None:
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(tmp, path)
+
+
+METRICS = Metrics()
+METRICS.describe("vpn_watchdog_vpn_running", "gauge", "1 if the VPN container is running")
+METRICS.describe("vpn_watchdog_vpn_up", "gauge", "1 if the VPN is running and not unhealthy")
+METRICS.describe("vpn_watchdog_vpn_health_status", "gauge", "Current VPN healthcheck status (1 for the active status)")
+METRICS.describe("vpn_watchdog_vpn_down_seconds", "gauge", "Seconds the VPN has been down (0 when up)")
+METRICS.describe("vpn_watchdog_detect_seconds", "histogram", "Time from a VPN restart/failure to the watchdog noticing it",
+                 (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300))
+METRICS.describe("vpn_watchdog_recover_seconds", "histogram", "Time from detection to recovery (VPN healthy / dependents handled)",
+                 (5, 10, 30, 60, 120, 300, 600, 1800, 3600))
+METRICS.describe("vpn_watchdog_actions_total", "counter", "Restart/start/recreate actions per group, container and result")
+METRICS.describe("vpn_watchdog_docker_request_seconds", "histogram", "Docker API request latency (per attempt)",
+                 (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30))
+METRICS.describe("vpn_watchdog_docker_retries_total", "counter", "Docker API request retries (5xx / timeouts / connection errors)")
+METRICS.describe("vpn_watchdog_cooldown_active", "gauge", "1 while the action cooldown is active")
+METRICS.describe("vpn_watchdog_cooldown_remaining_seconds", "gauge", "Seconds until the next action is allowed")
+METRICS.describe("vpn_watchdog_events_connected", "gauge", "1 while the Docker /events stream is connected")
+
+HEALTH_STATES = ("healthy", "unhealthy", "starting", "none", "missing")
+
+
+def start_metrics_server(bind: str, port: int) -> None:
+    class _Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+                self.send_error(404)
+                return
+            body = METRICS.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args) -> None:
+            pass
+
+    srv = ThreadingHTTPServer((bind, port), _Handler)
+    srv.daemon_threads = True
+    threading.Thread(target=srv.serve_forever, name="metrics", daemon=True).start()
+
+
+# -------------------------------
+# Container logs
+# -------------------------------
+
+class LogDemuxer:
+    """
+    Incremental parser for Docker's multiplexed log stream (non-TTY containers).
+
+    Each frame is an 8-byte header [stream, 0, 0, 0, size(4, big endian)] followed by size bytes; stream is
+    1=stdout, 2=stderr. TTY containers send raw bytes with no framing; that is detected on the first header
+    and everything is then reported as stdout. feed() accepts arbitrary chunk boundaries.
+    """
+
+    def __init__(self) -> None:
+        self.buf = bytearray()
+        self.raw: bool | None = None
+
+    def feed(self, chunk: bytes):
+        self.buf += chunk
+        if self.raw is None:
+            if len(self.buf) < 8:
+                return
+            self.raw = not (self.buf[0] in (0, 1, 2) and self.buf[1:4] == b"\0\0\0")
+        if self.raw:
+            data = bytes(self.buf)
+            self.buf.clear()
+            yield 1, data
+            return
+        while len(self.buf) >= 8:
+            size = int.from_bytes(self.buf[4:8], "big")
+            if len(self.buf) < 8 + size:
+                return
+            stream = self.buf[0]
+            data = bytes(self.buf[8 : 8 + size])
+            del self.buf[: 8 + size]
+            yield (2 if stream == 2 else 1), data
+
+    def flush(self):
+        """Whatever is left at EOF (a short TTY stream, or a truncated frame)."""
+        if self.buf:
+            data = bytes(self.buf if self.raw is not False else self.buf[8:])
+            self.buf.clear()
+            if data:
+                yield 1, data
+
+
+class BoundedLogBuffer:
+    """Keeps only the last max_bytes of (stream, bytes) chunks; render() prefixes stderr lines."""
+
+    def __init__(self, max_bytes: int = 65536):
+        self.max_bytes = max(1024, int(max_bytes))
+        self.chunks: deque = deque()
+        self.size = 0
+        self.dropped = 0
+
+    def add(self, stream: int, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            self.dropped += len(data) - self.max_bytes
+            data = data[-self.max_bytes :]
+        self.chunks.append((stream, data))
+        self.size += len(data)
+        while self.size > self.max_bytes:
+            _, old = self.chunks.popleft()
+            self.size -= len(old)
+            self.dropped += len(old)
+
+    def render(self) -> str:
+        out: list[str] = []
+        if self.dropped:
+            out.append(f"[... {self.dropped} bytes omitidos ...]")
+        # join per stream run so a line split across frames stays one line
+        runs: list[tuple[int, bytearray]] = []
+        for stream, data in self.chunks:
+            if runs and runs[-1][0] == stream:
+                runs[-1][1].extend(data)
+            else:
+                runs.append((stream, bytearray(data)))
+        for stream, data in runs:
+            text = data.decode("utf-8", errors="replace").rstrip("\n")
+            if stream == 2:
+                text = "\n".join("stderr| " + ln for ln in text.split("\n"))
+            out.append(text)
+        return "\n".join(out)
+
+
+def _endpoint_label(path: str) -> str:
+    """/containers/<name>/restart?t=30 -> /containers/{id}/restart (bounded label cardinality)."""
+    path = path.split("?", 1)[0]
+    return re.sub(r"^/containers/(?!json$|create$)[^/]+", "/containers/{id}", path)
+
+
 # -------------------------------
 # Docker API
 # -------------------------------
@@ -104,19 +355,28 @@ class DockerAPI:
         url = self._url(path)
         last_exc = None
 
+        endpoint = _endpoint_label(path)
+
         for attempt in range(1, self.retries + 1):
+            t_req = time.monotonic()
             try:
                 r = self.session.request(method, url, timeout=self.timeout, **kwargs)
+                METRICS.observe("vpn_watchdog_docker_request_seconds", time.monotonic() - t_req,
+                                method=method, endpoint=endpoint)
 
                 # Retry on transient 5xx
                 if r.status_code >= 500 and attempt < self.retries:
+                    METRICS.inc("vpn_watchdog_docker_retries_total", method=method, endpoint=endpoint)
                     time.sleep(self.retry_sleep * attempt)
                     continue
 
                 return r
             except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+                METRICS.observe("vpn_watchdog_docker_request_seconds", time.monotonic() - t_req,
+                                method=method, endpoint=endpoint)
                 last_exc = e
                 if attempt < self.retries:
+                    METRICS.inc("vpn_watchdog_docker_retries_total", method=method, endpoint=endpoint)
                     time.sleep(self.retry_sleep * attempt)
                     continue
                 raise
@@ -144,6 +404,10 @@ class DockerAPI:
         return r
 
     # Containers
+    def containers_list(self, filters: dict, all_: bool = True):
+        qs = f"all={1 if all_ else 0}&filters=" + quote(json.dumps(filters, separators=(",", ":")))
+        return self.get_json(f"/containers/json?{qs}")
+
     def container_inspect(self, name_or_id: str):
         return self.get_json(f"/containers/{name_or_id}/json")
 
@@ -168,15 +432,317 @@ class DockerAPI:
         # name must be query string
         return self.post(f"/containers/create?name={quote(name)}", json=payload)
 
-    def container_logs_tail(self, name_or_id: str, tail: int = 60):
-        url = f"/containers/{name_or_id}/logs?stdout=1&stderr=1&tail={int(tail)}"
-        r = self.request("GET", url)
+    # Images
+    def image_exists(self, image: str) -> bool:
+        r = self.request("GET", f"/images/{quote(image, safe='')}/json")
+        if r.status_code == 404:
+            return False
+        if r.status_code >= 400:
+            raise RuntimeError(f"GET image {image} -> {r.status_code}: {_brief(r.text, 200)}")
+        return True
+
+    def image_pull(self, image: str):
+        # Docker streams progress JSON until the pull finishes; errors show up inside the stream too
+        r = self.post(f"/images/create?fromImage={quote(image)}")
+        for line in r.text.splitlines():
+            try:
+                msg = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(msg, dict) and msg.get("error"):
+                raise RuntimeError(f"pull {image}: {_brief(msg['error'], 200)}")
+        return r
+
+    def events(self, filters: dict, since: int | None = None):
+        """
+        Open the streaming /events endpoint and return an iterator of decoded events.
+
+        The request is made here (so connection errors raise immediately); the iterator then blocks until
+        the daemon sends the next event. No read timeout: the stream is legitimately idle for hours.
+        """
+        qs = "filters=" + quote(json.dumps(filters, separators=(",", ":")))
+        if since:
+            qs += f"&since={int(since)}"
+        r = self.session.get(self._url(f"/events?{qs}"), stream=True, timeout=(self.timeout, None))
+        if r.status_code >= 400:
+            body = _brief(r.text, 300)
+            r.close()
+            raise RuntimeError(f"GET /events -> {r.status_code}: {body}")
+
+        def _iter():
+            with r:
+                for line in r.iter_lines():
+                    if not line:
+                        continue
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue
+
+        return _iter()
+
+    def container_logs_tail(self, name_or_id: str, tail: int = 60, max_bytes: int = 65536,
+                            follow_s: float = 0, since: float | None = None) -> str:
+        """
+        Last `tail` lines, streamed and demultiplexed, keeping at most max_bytes in memory.
+
+        With follow_s > 0 the stream stays open and new output is collected for that many seconds (e.g. right
+        after a restart, with since= the action start); a chatty container cannot stall it past the window.
+        """
+        qs = f"stdout=1&stderr=1&tail={int(tail)}"
+        if since:
+            qs += f"&since={int(since)}"
+        if follow_s > 0:
+            qs += "&follow=1"
+        path = f"/containers/{name_or_id}/logs?{qs}"
+        deadline = time.monotonic() + follow_s
+        read_timeout = min(self.timeout, follow_s) if follow_s > 0 else self.timeout
+        r = self.session.get(self._url(path), stream=True, timeout=(self.timeout, max(0.1, read_timeout)))
         if r.status_code >= 400:
-            raise RuntimeError(f"GET logs {name_or_id} -> {r.status_code}: {_brief(r.text, 200)}")
+            body = _brief(r.text, 200)
+            r.close()
+            raise RuntimeError(f"GET logs {name_or_id} -> {r.status_code}: {body}")
+
+        # requests fixes the read timeout per request; while following, shrink it to what is left of the window
+        # before every read so a quiet container cannot hold us past the deadline.
+        sock = getattr(getattr(r.raw, "_connection", None), "sock", None) if follow_s > 0 else None
+
+        demux = LogDemuxer()
+        buf = BoundedLogBuffer(max_bytes)
+        with r:
+            try:
+                if sock is not None:
+                    sock.settimeout(max(0.1, deadline - time.monotonic()))
+                for chunk in r.iter_content(chunk_size=8192):
+                    for stream, data in demux.feed(chunk):
+                        buf.add(stream, data)
+                    if follow_s > 0 and time.monotonic() >= deadline:
+                        break
+                    if sock is not None:
+                        sock.settimeout(max(0.1, deadline - time.monotonic()))
+            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError):
+                # follow window with a quiet container, or the daemon closed the stream
+                if not follow_s:
+                    raise
+        for stream, data in demux.flush():
+            buf.add(stream, data)
+        return buf.render()
+
+
+# -------------------------------
+# Container snapshot
+# -------------------------------
+
+class ContainerSnapshot:
+    """
+    State of a fixed set of containers from ONE /containers/json?all=1 listing.
+
+    The listing already carries Id, State and HostConfig.NetworkMode, which is all the netns check needs.
+    Full inspects are fetched lazily and kept until that container's summary changes.
+
+    Recreate payloads are staged ahead of time (prestage) and keyed by container Id only: a VPN restart kills
+    the dependents, which changes their State, but not their config, so the payload is still valid exactly
+    when it is needed.
+    """
+
+    def __init__(self, api: DockerAPI, names: list[str]):
+        self.api = api
+        self.names = list(dict.fromkeys(names))
+        self.summaries: dict[str, dict] = {}
+        self._keys: dict[str, tuple] = {}
+        self._inspects: dict[str, dict] = {}
+        self._staged: dict[str, tuple[str, dict]] = {}  # name -> (container Id, create payload)
+        self._images_ok: set[str] = set()
+        self._pulling: set[str] = set()
+        self._pull_lock = threading.Lock()
+
+    @staticmethod
+    def _key(row: dict) -> tuple:
+        return (row.get("Id"), row.get("State"), summary_network_mode(row))
+
+    def refresh(self) -> dict[str, dict]:
+        """Re-list the containers; return {name: summary} for the ones that exist."""
+        if not self.names:
+            self.summaries = {}
+            return {}
+        rows = self.api.containers_list({"name": [f"^/{re.escape(n)}$" for n in self.names]})
+        out: dict[str, dict] = {}
+        for row in rows or []:
+            for nm in row.get("Names") or []:
+                nm = nm.lstrip("/")
+                if nm in self.names:
+                    out[nm] = row
+
+        for name in self.names:
+            key = self._key(out[name]) if name in out else None
+            staged = self._staged.get(name)
+            if staged is not None and (key is None or staged[0] != key[0]):
+                del self._staged[name]
+            if self._keys.get(name) != key:
+                self._inspects.pop(name, None)
+                if key is None:
+                    self._keys.pop(name, None)
+                else:
+                    self._keys[name] = key
+        self.summaries = out
+        return out
+
+    def inspect(self, name: str) -> dict:
+        insp = self._inspects.get(name)
+        if insp is None:
+            insp = self.api.container_inspect(name)
+            self._inspects[name] = insp
+        return insp
+
+    def staged(self, name: str) -> tuple[str, dict] | None:
+        """(container Id, create payload) staged for name, or None."""
+        return self._staged.get(name)
+
+    def prestage(self, pull_images: bool = False) -> int:
+        """
+        Build the create payload of every listed container that has none yet (call after refresh()).
+        With pull_images, missing images are pulled in the background (ensure_image) so a recreate never waits
+        on a pull and a slow registry never holds up the tick.
+        Returns how many payloads were staged.
+        """
+        n = 0
+        for name, row in self.summaries.items():
+            cid = row.get("Id")
+            if not cid or name in self._staged:
+                continue
+            try:
+                insp = self.inspect(name)
+                payload = build_create_payload_from_inspect(insp, "")
+                if not payload.get("Image"):
+                    raise RuntimeError("inspect has no Config.Image")
+            except Exception as e:
+                log(f"prestage: {name}: {_brief(str(e), 220)}")
+                continue
+            self._staged[name] = (cid, payload)
+            n += 1
+        if pull_images:
+            for image in {payload["Image"] for _, payload in self._staged.values()}:
+                try:
+                    self.ensure_image(image)
+                except Exception as e:
+                    log(f"prestage: image {image}: {_brief(str(e), 220)}")
+        return n
+
+    def ensure_image(self, image: str) -> None:
+        """Start a background pull if image is not present locally; a failed pull is retried on the next call."""
+        with self._pull_lock:
+            if image in self._images_ok or image in self._pulling:
+                return
+        if self.api.image_exists(image):
+            with self._pull_lock:
+                self._images_ok.add(image)
+            return
+        with self._pull_lock:
+            if image in self._pulling:
+                return
+            self._pulling.add(image)
+        log(f"prestage: image {image} missing locally -> pull (background)")
+        threading.Thread(target=self._pull, args=(image,), name="wd-pull", daemon=True).start()
+
+    def _pull(self, image: str) -> None:
+        t_start = time.time()
         try:
-            return r.content.decode("utf-8", errors="replace")
-        except Exception:
-            return str(r.content[:500])
+            self.api.image_pull(image)
+        except Exception as e:
+            log(f"prestage: pull {image} FAIL: {_brief(str(e), 220)}")
+            with self._pull_lock:
+                self._pulling.discard(image)
+            return
+        log(f"prestage: pulled {image} in {time.time() - t_start:.1f}s")
+        with self._pull_lock:
+            self._pulling.discard(image)
+            self._images_ok.add(image)
+
+
+def summary_network_mode(row: dict) -> str:
+    return ((row.get("HostConfig") or {}).get("NetworkMode") or "")
+
+
+# -------------------------------
+# Docker events
+# -------------------------------
+
+class EventWatcher:
+    """
+    Follows the Docker /events stream for the watched containers in a background thread.
+
+    Each group loop blocks in wait() on its own subscription instead of time.sleep(): it wakes up as soon as
+    its VPN or one of its dependents changes state. While the stream is connected, the periodic inspect is
+    only a slow reconciliation poll.
+    """
+
+    EVENTS = ["health_status", "die", "start", "destroy", "create"]
+
+    def __init__(self, api: DockerAPI, containers: list[str]):
+        self.api = api
+        self.filters = {"type": ["container"], "container": containers, "event": self.EVENTS}
+        self._subs: list[tuple[set[str], queue.Queue]] = []
+        self.connected = threading.Event()
+        self._since: int | None = None
+
+    def subscribe(self, containers: list[str]) -> queue.Queue:
+        """Queue that only receives events for these containers (call before start())."""
+        q: queue.Queue = queue.Queue()
+        self._subs.append((set(containers), q))
+        return q
+
+    def start(self) -> None:
+        threading.Thread(target=self._run, name="docker-events", daemon=True).start()
+
+    def _on_open(self) -> None:
+        self.connected.set()
+        METRICS.set("vpn_watchdog_events_connected", 1)
+        log(f"events: conectado a /events ({','.join(self.filters['container'])})")
+
+    def _on_event(self, ev: dict) -> None:
+        # resume from here after a reconnect (Docker re-sends that second; duplicates only cause a wake-up)
+        self._since = int(ev.get("time") or time.time())
+        name = ((ev.get("Actor") or {}).get("Attributes") or {}).get("name")
+        for names, q in self._subs:
+            if name is None or name in names:
+                q.put(ev)
+
+    def _on_disconnected(self) -> None:
+        self.connected.clear()
+        METRICS.set("vpn_watchdog_events_connected", 0)
+
+    def _run(self) -> None:
+        backoff = 1.0
+        while True:
+            try:
+                stream = self.api.events(self.filters, since=self._since)
+                self._on_open()
+                backoff = 1.0
+                for ev in stream:
+                    self._on_event(ev)
+                log("events: stream cerrado por el daemon; reconectando")
+            except Exception as e:
+                log(f"events: stream error: {_brief(str(e), 220)}; reconectando en {int(backoff)}s")
+            self._on_disconnected()
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 30.0)
+
+    @staticmethod
+    def wait(q: queue.Queue, timeout: float) -> list[dict]:
+        """Block until an event arrives on q or timeout expires; return the whole burst of queued events."""
+        out: list[dict] = []
+        try:
+            out.append(q.get(timeout=max(0.0, timeout)))
+            while True:
+                out.append(q.get_nowait())
+        except queue.Empty:
+            pass
+        return out
+
+
+def describe_event(ev: dict) -> str:
+    name = ((ev.get("Actor") or {}).get("Attributes") or {}).get("name") or (ev.get("id") or "")[:12]
+    return f"{name}:{ev.get('Action') or ev.get('status')}"
 
 
 # -------------------------------
@@ -237,7 +803,13 @@ def build_create_payload_from_inspect(dep_insp: dict, vpn_id: str) -> dict:
     return payload
 
 
-def recreate_container(api: DockerAPI, name: str, old_inspect: dict, new_netns_id: str, log) -> bool:
+def payload_for_netns(payload: dict, vpn_id: str) -> dict:
+    """Copy of a staged create payload pointed at the current VPN namespace."""
+    return dict(payload, HostConfig=dict(payload.get("HostConfig") or {}, NetworkMode=f"container:{vpn_id}"))
+
+
+def recreate_container(api: DockerAPI, name: str, old_inspect: dict, new_netns_id: str, log,
+                       payload: dict | None = None, stop_timeout_s: int = 20, group: str = "") -> bool:
     """
     Recreate a container so it joins the VPN container network namespace.
 
@@ -248,6 +820,9 @@ def recreate_container(api: DockerAPI, name: str, old_inspect: dict, new_netns_i
     - create+start new with original name
     - remove old backup
     If create fails, we attempt to restore the old name and start it again.
+
+    payload is a pre-staged create payload (ContainerSnapshot.prestage); then old_inspect only needs "Id".
+    group is only the label of the action metrics.
     """
     if not old_inspect:
         log(f"recreate: no inspect template for {name}; cannot recreate (run `docker compose up -d {name}` once)")
@@ -262,7 +837,7 @@ def recreate_container(api: DockerAPI, name: str, old_inspect: dict, new_netns_i
         if old_id:
             # stop first to avoid two writers on same volumes
             try:
-                api.container_stop(name, timeout_s=int(os.environ.get("STOP_TIMEOUT_S", "20")))
+                api.container_stop(name, timeout_s=stop_timeout_s)
             except Exception as e:
                 # If it's already stopped/dead, continue
                 log(f"recreate: stop {name} WARN: {e}")
@@ -274,11 +849,14 @@ def recreate_container(api: DockerAPI, name: str, old_inspect: dict, new_netns_i
                 return False
 
         # Create the new container with the original name
-        payload = build_create_payload_from_inspect(old_inspect, new_netns_id)
-        created = api.container_create(name, payload)
+        if payload is not None:
+            payload = payload_for_netns(payload, new_netns_id)
+        else:
+            payload = build_create_payload_from_inspect(old_inspect, new_netns_id)
+        created = api.container_create(name, payload).json()
         new_id = created.get("Id") if isinstance(created, dict) else None
         if not new_id:
-            raise DockerAPIException("container_create returned no Id")
+            raise RuntimeError("container_create returned no Id")
 
         api.container_start(new_id)
 
@@ -289,11 +867,13 @@ def recreate_container(api: DockerAPI, name: str, old_inspect: dict, new_netns_i
             except Exception as e:
                 log(f"recreate: remove old backup {backup_name} WARN: {e}")
 
+        METRICS.inc("vpn_watchdog_actions_total", group=group, container=name, action="recreate", result="ok")
         return True
 
     except Exception as e:
         # Rollback: try to restore old container name and start it again
         log(f"recreate: create/start {name} FAIL: {e}")
+        METRICS.inc("vpn_watchdog_actions_total", group=group, container=name, action="recreate", result="fail")
         if old_id:
             try:
                 # If new container with 'name' exists partially, best effort remove it
@@ -330,21 +910,72 @@ def extract_container_target_id(network_mode: str) -> str | None:
     return None
 
 
-def ensure_dependents_attached(api: DockerAPI, vpn_id: str, dependents: list[str], stop_timeout_s: int, enabled: bool, verbose: bool) -> int:
+def run_ordered(names: list[str], fn, depends_on: dict[str, list[str]], workers: int) -> dict:
+    """
+    Run fn(name) for every name on a bounded thread pool and return {name: result or exception}.
+
+    A name only starts once the names it depends on (within this batch) have finished, so e.g. an exporter is
+    handled after the app it scrapes. Everything else runs concurrently.
+    """
+    pending = list(dict.fromkeys(n for n in names if n))
+    deps = {n: {d for d in depends_on.get(n, []) if d in pending and d != n} for n in pending}
+    done: set[str] = set()
+    results: dict = {}
+
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="wd-action") as pool:
+        running: dict = {}
+        while pending or running:
+            ready = [n for n in pending if deps[n] <= done]
+            if not ready and not running:
+                log(f"DEPENDS_ON tiene un ciclo entre {','.join(pending)}; se rompe en {pending[0]}")
+                ready = pending[:1]
+            for n in ready:
+                pending.remove(n)
+                running[pool.submit(fn, n)] = n
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                n = running.pop(fut)
+                done.add(n)
+                try:
+                    results[n] = fut.result()
+                except Exception as e:
+                    results[n] = e
+    return results
+
+
+def ensure_dependents_attached(
+    api: DockerAPI,
+    vpn_id: str,
+    dependents: list[str],
+    stop_timeout_s: int,
+    enabled: bool,
+    verbose: bool,
+    depends_on: dict[str, list[str]] | None = None,
+    workers: int = 4,
+    snapshot: ContainerSnapshot | None = None,
+    group: str = "",
+) -> int:
     """Return number of recreated containers."""
-    recreated = 0
     if not enabled:
         return 0
 
+    if snapshot is None:
+        snapshot = ContainerSnapshot(api, dependents)
+    try:
+        summaries = snapshot.refresh()
+    except Exception as e:
+        log(f"netns-check: cannot list containers: {_brief(str(e), 220)}")
+        return 0
+
+    mismatched: dict[str, tuple[dict, dict | None]] = {}  # name -> (old inspect, staged payload)
     for name in dependents:
-        try:
-            dinsp = api.container_inspect(name)
-        except Exception as e:
+        summ = summaries.get(name)
+        if summ is None:
             if verbose:
-                log(f"netns-check: cannot inspect {name}: {_brief(str(e), 220)}")
+                log(f"netns-check: {name} not found")
             continue
 
-        nm = get_network_mode(dinsp)
+        nm = summary_network_mode(summ)
         tgt = extract_container_target_id(nm)
 
         # Only fix those that are in container network mode.
@@ -353,10 +984,28 @@ def ensure_dependents_attached(api: DockerAPI, vpn_id: str, dependents: list[str
 
         if tgt != vpn_id:
             log(f"netns mismatch: {name} has {tgt[:12]} but vpn is {vpn_id[:12]} -> recreate")
-            ok = recreate_container(api, name=name, vpn_id=vpn_id, stop_timeout_s=stop_timeout_s, verbose=verbose)
-            if ok:
-                recreated += 1
+            staged = snapshot.staged(name)
+            if staged is not None:
+                mismatched[name] = ({"Id": staged[0]}, staged[1])
+                continue
+            try:
+                mismatched[name] = (snapshot.inspect(name), None)
+            except Exception as e:
+                log(f"netns-check: cannot inspect {name}: {_brief(str(e), 220)}")
 
+    if not mismatched:
+        return 0
+
+    t_start = time.time()
+    results = run_ordered(
+        list(mismatched),
+        lambda n: recreate_container(api, n, mismatched[n][0], vpn_id, log, payload=mismatched[n][1],
+                                     stop_timeout_s=stop_timeout_s, group=group),
+        depends_on or {},
+        workers,
+    )
+    recreated = sum(1 for ok in results.values() if ok is True)
+    log(f"netns: recreados {recreated}/{len(mismatched)} en {time.time() - t_start:.1f}s")
     return recreated
 
 
@@ -397,122 +1046,446 @@ def restart_or_recreate_targets(
     stop_timeout_s: int,
     recreate_on_netns_error: bool,
     log_tail: int,
+    depends_on: dict[str, list[str]] | None = None,
+    workers: int = 4,
+    snapshot: ContainerSnapshot | None = None,
+    log_max_bytes: int = 65536,
+    log_follow_s: float = 0,
+    group: str = "",
 ):
     log(f"accion sobre: {','.join(targets) if targets else '(none)'}")
 
-    for name in targets:
-        if not name:
-            continue
+    def recreate(name: str) -> bool:
+        staged = snapshot.staged(name) if snapshot is not None else None
+        if staged is not None:
+            return recreate_container(api, name, {"Id": staged[0]}, vpn_id, log, payload=staged[1],
+                                      stop_timeout_s=stop_timeout_s, group=group)
+        try:
+            insp = api.container_inspect(name)
+        except Exception as e:
+            log(f"recreate: cannot inspect {name}: {_brief(str(e), 220)}")
+            return False
+        return recreate_container(api, name, insp, vpn_id, log, stop_timeout_s=stop_timeout_s, group=group)
 
+    def act(name: str) -> None:
         try:
             api.container_restart(name, timeout_s=restart_timeout_s)
             log(f"restart OK: {name}")
-            continue
+            METRICS.inc("vpn_watchdog_actions_total", group=group, container=name, action="restart", result="ok")
+            return
         except Exception as e:
             msg = str(e)
             log(f"restart FAIL: {name}: {_brief(msg, 220)}")
+            METRICS.inc("vpn_watchdog_actions_total", group=group, container=name, action="restart", result="fail")
 
             # Netns missing -> recreate is the only real fix
             if recreate_on_netns_error and is_netns_join_error(msg):
                 log(f"netns error detected on {name} -> recreate")
-                recreate_container(api, name=name, vpn_id=vpn_id, stop_timeout_s=stop_timeout_s)
-                continue
+                recreate(name)
+                return
 
             # Fallback: try start
             try:
                 api.container_start(name)
                 log(f"start OK (fallback): {name}")
+                METRICS.inc("vpn_watchdog_actions_total", group=group, container=name, action="start", result="ok")
             except Exception as e2:
                 log(f"start FAIL: {name}: {_brief(str(e2), 220)}")
+                METRICS.inc("vpn_watchdog_actions_total", group=group, container=name, action="start", result="fail")
                 if recreate_on_netns_error and is_netns_join_error(str(e2)):
                     log(f"netns error detected on start {name} -> recreate")
-                    recreate_container(api, name=name, vpn_id=vpn_id, stop_timeout_s=stop_timeout_s)
+                    recreate(name)
+
+    # The VPN itself (RESTART_VPN=1) must be back before anything that joins its namespace.
+    deps = {n: list(v) for n, v in (depends_on or {}).items()}
+    if vpn_container in targets:
+        for name in targets:
+            if name != vpn_container:
+                deps.setdefault(name, []).append(vpn_container)
 
-    # tail logs del VPN para diagnóstico
+    t_start = time.time()
+    run_ordered(targets, act, deps, workers)
+    log(f"acciones completadas en {time.time() - t_start:.1f}s")
+
+    # tail logs del VPN para diagnóstico; with LOG_FOLLOW_S, what it printed since the actions started
     try:
-        tail = api.container_logs_tail(vpn_container, tail=log_tail)
-        log(f"--- {vpn_container} logs tail({log_tail}) ---\n{tail}\n--- end tail ---")
+        if log_follow_s > 0:
+            tail = api.container_logs_tail(vpn_container, tail=log_tail, max_bytes=log_max_bytes,
+                                           follow_s=log_follow_s, since=t_start)
+            log(f"--- {vpn_container} logs follow({log_follow_s:g}s) ---\n{tail}\n--- end logs ---")
+        else:
+            tail = api.container_logs_tail(vpn_container, tail=log_tail, max_bytes=log_max_bytes)
+            log(f"--- {vpn_container} logs tail({log_tail}) ---\n{tail}\n--- end tail ---")
     except Exception as ex:
         log(f"could not fetch {vpn_container} logs: {ex}")
 
 
+def update_vpn_metrics(group: str, state_status: str, health_status: str, down: bool, down_since: float | None,
+                       next_action_after: float, now: float) -> None:
+    METRICS.set("vpn_watchdog_vpn_running", 1 if state_status == "running" else 0, group=group)
+    METRICS.set("vpn_watchdog_vpn_up", 0 if down else 1, group=group)
+    status = health_status if health_status in HEALTH_STATES else "none"
+    for st in HEALTH_STATES:
+        METRICS.set("vpn_watchdog_vpn_health_status", 1 if st == status else 0, group=group, status=st)
+    METRICS.set("vpn_watchdog_vpn_down_seconds", (now - down_since) if down_since is not None else 0, group=group)
+    remaining = max(0.0, next_action_after - now)
+    METRICS.set("vpn_watchdog_cooldown_active", 1 if remaining > 0 else 0, group=group)
+    METRICS.set("vpn_watchdog_cooldown_remaining_seconds", remaining, group=group)
+
+
 # -------------------------------
-# Main
+# Groups (VPN -> dependents)
 # -------------------------------
 
+@dataclass
+class GroupConfig:
+    """One network-namespace group: a VPN container and the containers that share its netns."""
 
-def main() -> int:
-    vpn_container = getenv_str("VPN_CONTAINER", "vpn-stable")
-    dependents = [x.strip() for x in getenv_str("DEPENDENTS", "").split(",") if x.strip()]
+    name: str
+    vpn_container: str
+    dependents: list[str] = field(default_factory=list)
+    depends_on: dict[str, list[str]] = field(default_factory=dict)
 
-    check_interval = getenv_int("CHECK_INTERVAL", 10)
-    startup_grace = getenv_int("STARTUP_GRACE", 90)
-    down_grace = getenv_int("DOWN_GRACE", 180)
-    cooldown = getenv_int("COOLDOWN", 120)
+    startup_grace: int = 90
+    down_grace: int = 180
+    cooldown: int = 120
 
-    verbose = getenv_bool("VERBOSE", True)
-    print_health_logs = getenv_bool("PRINT_HEALTH_LOGS", True)
-    log_tail = getenv_int("PRINT_CONTAINER_LOG_TAIL", 60)
+    restart_vpn: bool = False
+    restart_on_vpn_restart: bool = True
+    vpn_restart_grace: int = 15
 
-    restart_vpn = getenv_bool("RESTART_VPN", False)
+    recreate_on_netns_mismatch: bool = True
+    recreate_on_netns_error: bool = True
+    stop_timeout_s: int = 20
+    restart_timeout_s: int = 30
 
-    restart_on_vpn_restart = getenv_bool("RESTART_ON_VPN_RESTART", True)
-    vpn_restart_grace = getenv_int("VPN_RESTART_GRACE", 15)
 
-    # v4
-    recreate_on_netns_mismatch = getenv_bool("RECREATE_ON_NETNS_MISMATCH", True)
-    recreate_on_netns_error = getenv_bool("RECREATE_ON_NETNS_ERROR", True)
-    stop_timeout_s = getenv_int("STOP_TIMEOUT_S", 20)
-    restart_timeout_s = getenv_int("RESTART_TIMEOUT_S", 30)
+def group_defaults_from_env() -> dict:
+    """Per-group settings from the classic env vars; they are also the defaults for every group in WATCHDOG_CONFIG."""
+    return {
+        "startup_grace": getenv_int("STARTUP_GRACE", 90),
+        "down_grace": getenv_int("DOWN_GRACE", 180),
+        "cooldown": getenv_int("COOLDOWN", 120),
+        "restart_vpn": getenv_bool("RESTART_VPN", False),
+        "restart_on_vpn_restart": getenv_bool("RESTART_ON_VPN_RESTART", True),
+        "vpn_restart_grace": getenv_int("VPN_RESTART_GRACE", 15),
+        "recreate_on_netns_mismatch": getenv_bool("RECREATE_ON_NETNS_MISMATCH", True),
+        "recreate_on_netns_error": getenv_bool("RECREATE_ON_NETNS_ERROR", True),
+        "stop_timeout_s": getenv_int("STOP_TIMEOUT_S", 20),
+        "restart_timeout_s": getenv_int("RESTART_TIMEOUT_S", 30),
+        "depends_on": parse_depends_on(getenv_str("DEPENDS_ON", "")),
+    }
 
-    docker_host = getenv_str("DOCKER_HOST", "unix:///var/run/docker.sock")
-    docker_timeout = getenv_int("DOCKER_TIMEOUT", 30)
-    api_retries = getenv_int("DOCKER_RETRIES", 3)
-    api_retry_sleep = float(getenv_str("DOCKER_RETRY_SLEEP", "1"))
 
-    api = DockerAPI(docker_host=docker_host, timeout=docker_timeout, retries=api_retries, retry_sleep=api_retry_sleep)
+def _as_list(v) -> list[str]:
+    if isinstance(v, str):
+        return [x.strip() for x in v.split(",") if x.strip()]
+    return [str(x).strip() for x in (v or []) if str(x).strip()]
+
+
+_TRUE = ("1", "true", "yes", "y", "on")
+_FALSE = ("0", "false", "no", "n", "off")
+
+
+def _coerce_option(where: str, key: str, value, typ: type):
+    """Convert a groups-file value to its GroupConfig type (ints and bools may come quoted from YAML)."""
+    if typ is bool:
+        if isinstance(value, bool):
+            return value
+        if isinstance(value, int) and value in (0, 1):
+            return bool(value)
+        if isinstance(value, str) and value.strip().lower() in _TRUE + _FALSE:
+            return value.strip().lower() in _TRUE
+        raise RuntimeError(f"{where}: {key}={value!r} no es un booleano (true/false, 1/0)")
+    if typ is int:
+        if isinstance(value, int) and not isinstance(value, bool):
+            return value
+        if isinstance(value, float) and value.is_integer():
+            return int(value)
+        if isinstance(value, str):
+            try:
+                return int(value.strip())
+            except ValueError:
+                pass
+        raise RuntimeError(f"{where}: {key}={value!r} no es un entero")
+    return value
 
-    log("========================================================")
-    log("watchdog v4 (restart + netns-recreate) - starting")
-    log(f"DOCKER_HOST={docker_host} timeout={docker_timeout}s retries={api_retries}")
-    log(f"VPN_CONTAINER={vpn_container}")
-    log(f"DEPENDENTS={','.join(dependents) if dependents else '(none)'}")
-    log(f"CHECK_INTERVAL={check_interval}s STARTUP_GRACE={startup_grace}s DOWN_GRACE={down_grace}s COOLDOWN={cooldown}s")
-    log(f"RESTART_ON_VPN_RESTART={int(restart_on_vpn_restart)} VPN_RESTART_GRACE={vpn_restart_grace}s")
-    log(f"RECREATE_ON_NETNS_MISMATCH={int(recreate_on_netns_mismatch)} RECREATE_ON_NETNS_ERROR={int(recreate_on_netns_error)}")
-    log(f"STOP_TIMEOUT_S={stop_timeout_s} RESTART_TIMEOUT_S={restart_timeout_s}")
-    log(f"RESTART_VPN={int(restart_vpn)} VERBOSE={int(verbose)} PRINT_HEALTH_LOGS={int(print_health_logs)} LOG_TAIL={log_tail}")
-    log("========================================================")
 
-    t0 = time.time()
+def _depends_on_option(where: str, value) -> dict[str, list[str]]:
+    if isinstance(value, str):
+        return parse_depends_on(value)
+    if value is None:
+        return {}
+    if not isinstance(value, dict):
+        raise RuntimeError(f"{where}: depends_on debe ser un mapa contenedor -> [contenedores]")
+    return {str(k): _as_list(v) for k, v in value.items()}
+
+
+def load_groups(path: str | None) -> list[GroupConfig]:
+    """
+    Groups from WATCHDOG_CONFIG (YAML or JSON) or, without it, the single VPN_CONTAINER/DEPENDENTS group.
+
+        defaults: {down_grace: 180, cooldown: 120}
+        groups:
+          - name: stable
+            vpn: vpn-stable
+            dependents: [dispatcharr, dispatcharr-exporter]
+            depends_on: {dispatcharr-exporter: [dispatcharr]}
+          - vpn: vpn-p2p
+            dependents: qbittorrent
+            down_grace: 60
+    """
+    base = group_defaults_from_env()
+    if not path:
+        vpn = getenv_str("VPN_CONTAINER", "vpn-stable")
+        deps = _as_list(getenv_str("DEPENDENTS", ""))
+        return [GroupConfig(name=vpn, vpn_container=vpn, dependents=deps, **base)]
+
+    with open(path, "r", encoding="utf-8") as f:
+        raw = f.read()
+    if path.lower().endswith((".yml", ".yaml")):
+        if yaml is None:
+            raise RuntimeError("Falta PyYAML para WATCHDOG_CONFIG .yml. Instala con: pip install pyyaml")
+        cfg = yaml.safe_load(raw)
+    else:
+        cfg = json.loads(raw)
+    if not isinstance(cfg, dict) or not isinstance(cfg.get("groups"), list):
+        raise RuntimeError(f"{path}: se esperaba un objeto con una lista 'groups'")
+
+    types = {f.name: f.type for f in fields(GroupConfig)}
+    known = set(types) - {"name", "vpn_container", "dependents", "depends_on"}
+
+    def options(where: str, raw: dict, ignore: set[str]) -> dict:
+        out = {}
+        for k, v in raw.items():
+            if k in known:
+                out[k] = _coerce_option(where, k, v, types[k])
+            elif k == "depends_on":
+                out[k] = _depends_on_option(where, v)
+            elif k not in ignore:
+                log(f"WATCHDOG_CONFIG {where}: clave desconocida '{k}' ignorada")
+        return out
+
+    raw_defaults = cfg.get("defaults") or {}
+    if not isinstance(raw_defaults, dict):
+        raise RuntimeError(f"{path}: 'defaults' debe ser un objeto")
+    defaults = dict(base)
+    defaults.update(options(f"{path} defaults", raw_defaults, set()))
+
+    groups: list[GroupConfig] = []
+    seen: set[str] = set()
+    for i, g in enumerate(cfg["groups"], 1):
+        if not isinstance(g, dict):
+            raise RuntimeError(f"{path}: el grupo #{i} no es un objeto")
+        vpn = str(g.get("vpn") or g.get("vpn_container") or "").strip()
+        if not vpn:
+            raise RuntimeError(f"{path}: el grupo #{i} no tiene 'vpn'")
+        name = str(g.get("name") or vpn)
+        if name in seen:
+            raise RuntimeError(f"{path}: grupo duplicado '{name}'")
+        seen.add(name)
+
+        opts = dict(defaults)
+        opts.update(options(f"{path} grupo '{name}'", g, {"name", "vpn", "vpn_container", "dependents"}))
+        groups.append(GroupConfig(name=name, vpn_container=vpn, dependents=_as_list(g.get("dependents")), **opts))
+    return groups
+
 
-    last_health_status = None
-    last_state_status = None
+# -------------------------------
+# State file
+# -------------------------------
 
-    last_vpn_id: str | None = None
-    last_started_at: str | None = None
-    last_restart_count: int | None = None
+def load_state(path: str) -> dict:
+    """{"version": 1, "groups": {name: {...}}}; a missing or unreadable file is just an empty state."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return {"version": 1, "groups": {}}
+    except Exception as e:
+        log(f"state: no se pudo leer {path}: {_brief(str(e), 200)}; empezando de cero")
+        return {"version": 1, "groups": {}}
+    if not isinstance(data, dict) or not isinstance(data.get("groups"), dict):
+        return {"version": 1, "groups": {}}
+    return data
 
-    pending_vpn_restart_since: float | None = None
-    pending_vpn_id_change: bool = False
 
-    down_since: float | None = None
-    next_action_after: float = 0.0
+def save_state(path: str, state: dict) -> None:
+    d = os.path.dirname(path)
+    if d:
+        os.makedirs(d, exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
 
-    while True:
-        loop_t = time.time()
-        uptime = int(loop_t - t0)
+
+class VpnSupervisor:
+    """
+    Health/restart/netns state machine for one group. tick() does one pass and returns True when idle (healthy),
+    so the caller can wait for the slower reconcile interval.
+
+    All Docker access goes through api (DockerAPI surface) and all time through clock(), so simulate.py can
+    drive it with a fake daemon and a virtual clock.
+    """
+
+    # What survives a watchdog restart (STATE_FILE). All timestamps come from clock() (wall clock by default).
+    PERSISTED = (
+        "last_vpn_id",
+        "last_started_at",
+        "last_restart_count",
+        "pending_vpn_restart_since",
+        "pending_vpn_id_change",
+        "down_since",
+        "detected_at",
+        "next_action_after",
+    )
+
+    def __init__(self, api: DockerAPI, cfg: GroupConfig, *, verbose: bool, print_health_logs: bool, log_tail: int,
+                 action_workers: int, prefix_logs: bool = False, prestage: bool = True, pull_images: bool = False,
+                 clock=time.time, log_max_bytes: int = 65536, log_follow_s: float = 0):
+        self.api = api
+        self.clock = clock
+        self.cfg = cfg
+        self.verbose = verbose
+        self.print_health_logs = print_health_logs
+        self.log_tail = log_tail
+        self.log_max_bytes = log_max_bytes
+        self.log_follow_s = log_follow_s
+        self.action_workers = action_workers
+        self.prefix = f"[{cfg.name}] " if prefix_logs else ""
+        self.snapshot = ContainerSnapshot(api, cfg.dependents)
+        self.prestage = prestage
+        self.pull_images = pull_images
+
+        self.t0 = self.clock()
+
+        self.last_health_status: str | None = None
+        self.last_state_status: str | None = None
+
+        self.last_vpn_id: str | None = None
+        self.last_started_at: str | None = None
+        self.last_restart_count: int | None = None
+
+        self.pending_vpn_restart_since: float | None = None
+        self.pending_vpn_id_change: bool = False
+
+        self.down_since: float | None = None
+        self.next_action_after: float = 0.0
+
+        # time-to-recover is measured from the first detection, not from the last action (which resets down_since)
+        self.detected_at: float | None = None
+
+        self.state_status = "missing"
+        self.health_status = "missing"
+        self.down = True
+
+    def log(self, msg: str) -> None:
+        log(self.prefix + msg)
+
+    def export_state(self) -> dict:
+        out = {k: getattr(self, k) for k in self.PERSISTED}
+        out["vpn_container"] = self.cfg.vpn_container
+        return out
+
+    def restore_state(self, data: dict, saved_at: float, max_age: int, now: float) -> bool:
+        """
+        Resume from a checkpoint. A fresh one (younger than max_age, same VPN container) restores everything and
+        skips STARTUP_GRACE; an old one only keeps a cooldown that is still running. Returns True if fresh.
+        """
+        if not isinstance(data, dict) or data.get("vpn_container") != self.cfg.vpn_container:
+            return False
+        nxt = data.get("next_action_after")
+        if isinstance(nxt, (int, float)) and nxt > now:
+            self.next_action_after = float(nxt)
+        if not (0 <= now - saved_at <= max_age):
+            return False
+        for k in self.PERSISTED:
+            if k in data:
+                setattr(self, k, data[k])
+        self.t0 = now - self.cfg.startup_grace
+        return True
+
+    def update_metrics(self, now: float) -> None:
+        update_vpn_metrics(self.cfg.name, self.state_status, self.health_status, self.down, self.down_since,
+                           self.next_action_after, now)
+
+    def _log_tail(self) -> None:
+        vpn_container = self.cfg.vpn_container
+        try:
+            tail = self.api.container_logs_tail(vpn_container, tail=self.log_tail, max_bytes=self.log_max_bytes)
+            self.log(f"--- {vpn_container} logs tail({self.log_tail}) ---\n{tail}\n--- end tail ---")
+        except Exception as ex:
+            self.log(f"could not fetch {vpn_container} logs: {ex}")
+
+    def _attach(self, vpn_id: str, enabled: bool) -> None:
+        ensure_dependents_attached(
+            self.api,
+            vpn_id=vpn_id,
+            dependents=self.cfg.dependents,
+            stop_timeout_s=self.cfg.stop_timeout_s,
+            enabled=enabled,
+            verbose=self.verbose,
+            depends_on=self.cfg.depends_on,
+            workers=self.action_workers,
+            snapshot=self.snapshot,
+            group=self.cfg.name,
+        )
+
+    def _restart_targets(self, vpn_id: str) -> None:
+        cfg = self.cfg
+        targets = []
+        if cfg.restart_vpn:
+            targets.append(cfg.vpn_container)
+        targets.extend(cfg.dependents)
+        restart_or_recreate_targets(
+            self.api,
+            vpn_id=vpn_id,
+            vpn_container=cfg.vpn_container,
+            targets=targets,
+            restart_timeout_s=cfg.restart_timeout_s,
+            stop_timeout_s=cfg.stop_timeout_s,
+            recreate_on_netns_error=cfg.recreate_on_netns_error,
+            log_tail=self.log_tail,
+            log_max_bytes=self.log_max_bytes,
+            log_follow_s=self.log_follow_s,
+            depends_on=cfg.depends_on,
+            workers=self.action_workers,
+            snapshot=self.snapshot,
+            group=cfg.name,
+        )
+
+    def _prestage(self, refreshed: bool) -> None:
+        """Keep a create payload ready for every dependent so a netns recreate skips inspect/build (and pulls)."""
+        if not self.prestage or not self.cfg.dependents:
+            return
+        try:
+            if not refreshed:
+                self.snapshot.refresh()
+            n = self.snapshot.prestage(pull_images=self.pull_images)
+        except Exception as e:
+            self.log(f"prestage: {_brief(str(e), 220)}")
+            return
+        if n and self.verbose:
+            self.log(f"prestage: {n} payload(s) de recreate preparados")
+
+    def tick(self) -> bool:
+        cfg = self.cfg
+        vpn_container = cfg.vpn_container
+        loop_t = self.clock()
+        uptime = int(loop_t - self.t0)
 
         vpn_id = None
         state_status = "missing"
         health_status = "missing"
         health_summary = {}
         started_at = None
+        state_finished_at = None
         restart_count = None
         down = True
 
         try:
-            insp = api.container_inspect(vpn_container)
+            insp = self.api.container_inspect(vpn_container)
             vpn_id = get_container_id(insp)
             state = (insp.get("State") or {})
             state_status = state.get("Status")  # running/exited/...
@@ -520,6 +1493,7 @@ def main() -> int:
             health_summary = summarize_health(health)
             health_status = health_summary.get("Status") or "none"
             started_at = state.get("StartedAt")
+            state_finished_at = state.get("FinishedAt")
             restart_count = int(state.get("RestartCount") or 0)
 
             # Down definition
@@ -533,168 +1507,304 @@ def main() -> int:
         except Exception as e:
             health_summary = {"error": _brief(str(e), 300)}
 
+        self.state_status = state_status
+        self.health_status = health_status
+        self.down = down
+
         # Detect vpn restarts / id changes
         if vpn_id:
-            if last_vpn_id is not None and vpn_id != last_vpn_id:
-                pending_vpn_restart_since = loop_t
-                pending_vpn_id_change = True
-                log(f"VPN ID cambió (recreate probable): {last_vpn_id[:12]} -> {vpn_id[:12]}")
-
-            if restart_on_vpn_restart:
-                if last_started_at is not None and started_at and started_at != last_started_at:
-                    pending_vpn_restart_since = loop_t
-                    log(f"VPN restart detectado (StartedAt cambió): {last_started_at} -> {started_at}")
-                if last_restart_count is not None and restart_count is not None and restart_count > last_restart_count:
-                    pending_vpn_restart_since = loop_t
-                    log(f"VPN restart detectado (RestartCount): {last_restart_count} -> {restart_count}")
-
-            last_vpn_id = vpn_id
-            last_started_at = started_at
-            last_restart_count = restart_count
+            if self.last_vpn_id is not None and vpn_id != self.last_vpn_id:
+                self.pending_vpn_restart_since = loop_t
+                self.pending_vpn_id_change = True
+                self.log(f"VPN ID cambió (recreate probable): {self.last_vpn_id[:12]} -> {vpn_id[:12]}")
+
+            if cfg.restart_on_vpn_restart:
+                if self.last_started_at is not None and started_at and started_at != self.last_started_at:
+                    self.pending_vpn_restart_since = loop_t
+                    self.log(f"VPN restart detectado (StartedAt cambió): {self.last_started_at} -> {started_at}")
+                    started_ts = parse_docker_time(started_at)
+                    if started_ts is not None:
+                        METRICS.observe("vpn_watchdog_detect_seconds", max(0.0, loop_t - started_ts),
+                                        group=cfg.name, kind="vpn_restart")
+                if (self.last_restart_count is not None and restart_count is not None
+                        and restart_count > self.last_restart_count):
+                    self.pending_vpn_restart_since = loop_t
+                    self.log(f"VPN restart detectado (RestartCount): {self.last_restart_count} -> {restart_count}")
+
+            self.last_vpn_id = vpn_id
+            self.last_started_at = started_at
+            self.last_restart_count = restart_count
 
         # Print state change
-        changed = (health_status != last_health_status) or (state_status != last_state_status)
+        changed = (health_status != self.last_health_status) or (state_status != self.last_state_status)
         if changed:
-            log(f"STATE CHANGE: docker_state={state_status} health={health_status}")
-            if verbose:
-                log("health_summary=" + json.dumps(health_summary, ensure_ascii=False))
-            if print_health_logs and state_status == "running":
+            self.log(f"STATE CHANGE: docker_state={state_status} health={health_status}")
+            if self.verbose:
+                self.log("health_summary=" + json.dumps(health_summary, ensure_ascii=False))
+            if self.print_health_logs and state_status == "running":
                 try:
-                    insp2 = api.container_inspect(vpn_container)
+                    insp2 = self.api.container_inspect(vpn_container)
                     logs = (((insp2.get("State") or {}).get("Health") or {}).get("Log") or [])
                     tail = logs[-5:]
                     for i, entry in enumerate(tail, 1):
                         out = (entry.get("Output") or "").strip().replace("\n", "\\n")
-                        log(
+                        self.log(
                             f"health_log[-{len(tail)-i+1}]: exit={entry.get('ExitCode')} start={entry.get('Start')} end={entry.get('End')} out='{out[:240]}'"
                         )
                 except Exception as ex:
-                    log(f"could not read health logs: {ex}")
+                    self.log(f"could not read health logs: {ex}")
 
-        last_health_status = health_status
-        last_state_status = state_status
+        self.last_health_status = health_status
+        self.last_state_status = state_status
 
         # Startup grace
-        if uptime < startup_grace:
-            if verbose:
-                log(f"startup grace: uptime={uptime}s (ignoring down={int(down)})")
-            time.sleep(check_interval)
-            continue
+        if uptime < cfg.startup_grace:
+            if self.verbose:
+                self.log(f"startup grace: uptime={uptime}s (ignoring down={int(down)})")
+            return False
 
         # Continuous netns mismatch guard (fix even if VPN looks OK)
-        if vpn_id and dependents:
-            ensure_dependents_attached(
-                api,
-                vpn_id=vpn_id,
-                dependents=dependents,
-                stop_timeout_s=stop_timeout_s,
-                enabled=recreate_on_netns_mismatch,
-                verbose=verbose,
-            )
+        if vpn_id and cfg.dependents:
+            self._attach(vpn_id, cfg.recreate_on_netns_mismatch)
+        self._prestage(refreshed=bool(vpn_id and cfg.dependents and cfg.recreate_on_netns_mismatch))
 
         # ACTION: VPN restart detected
-        if pending_vpn_restart_since is not None and vpn_id:
-            elapsed = int(loop_t - pending_vpn_restart_since)
-            if elapsed >= vpn_restart_grace:
-                if loop_t >= next_action_after:
+        if self.pending_vpn_restart_since is not None and vpn_id:
+            elapsed = int(loop_t - self.pending_vpn_restart_since)
+            if elapsed >= cfg.vpn_restart_grace:
+                if loop_t >= self.next_action_after:
                     # If VPN id changed, we MUST recreate dependents.
-                    if pending_vpn_id_change and recreate_on_netns_mismatch:
-                        log(f"VPN reiniciado + ID cambió; tras {elapsed}s => recreando dependientes")
-                        ensure_dependents_attached(
-                            api,
-                            vpn_id=vpn_id,
-                            dependents=dependents,
-                            stop_timeout_s=stop_timeout_s,
-                            enabled=True,
-                            verbose=verbose,
-                        )
+                    if self.pending_vpn_id_change and cfg.recreate_on_netns_mismatch:
+                        self.log(f"VPN reiniciado + ID cambió; tras {elapsed}s => recreando dependientes")
+                        self._attach(vpn_id, True)
                     else:
-                        targets = []
-                        if restart_vpn:
-                            targets.append(vpn_container)
-                        targets.extend(dependents)
-                        log(f"VPN se reinició; tras {elapsed}s => reiniciando dependientes")
-                        restart_or_recreate_targets(
-                            api,
-                            vpn_id=vpn_id,
-                            vpn_container=vpn_container,
-                            targets=targets,
-                            restart_timeout_s=restart_timeout_s,
-                            stop_timeout_s=stop_timeout_s,
-                            recreate_on_netns_error=recreate_on_netns_error,
-                            log_tail=log_tail,
-                        )
-
-                    next_action_after = time.time() + cooldown
-                    pending_vpn_restart_since = None
-                    pending_vpn_id_change = False
+                        self.log(f"VPN se reinició; tras {elapsed}s => reiniciando dependientes")
+                        self._restart_targets(vpn_id)
+
+                    METRICS.observe("vpn_watchdog_recover_seconds", self.clock() - self.pending_vpn_restart_since,
+                                    group=cfg.name, kind="vpn_restart")
+                    self.next_action_after = self.clock() + cfg.cooldown
+                    self.pending_vpn_restart_since = None
+                    self.pending_vpn_id_change = False
                 else:
-                    if verbose:
-                        log(f"VPN restart pendiente pero cooldown activo: {int(next_action_after-loop_t)}s")
+                    if self.verbose:
+                        self.log(f"VPN restart pendiente pero cooldown activo: {int(self.next_action_after-loop_t)}s")
             else:
-                if verbose:
-                    log(f"VPN restart pendiente: elapsed={elapsed}s (grace={vpn_restart_grace}s)")
-
-            time.sleep(check_interval)
-            continue
+                if self.verbose:
+                    self.log(f"VPN restart pendiente: elapsed={elapsed}s (grace={cfg.vpn_restart_grace}s)")
+            return False
 
         # If not down
         if not down:
-            if down_since is not None:
-                log(f"RECOVERED: was down for {int(loop_t - down_since)}s; now healthy")
-            down_since = None
-            if verbose:
-                log(f"OK: docker_state={state_status} health={health_status} uptime={uptime}s")
-            time.sleep(check_interval)
-            continue
+            if self.down_since is not None:
+                self.log(f"RECOVERED: was down for {int(loop_t - self.down_since)}s; now healthy")
+            if self.detected_at is not None:
+                METRICS.observe("vpn_watchdog_recover_seconds", loop_t - self.detected_at, group=cfg.name, kind="down")
+            self.down_since = None
+            self.detected_at = None
+            if self.verbose:
+                self.log(f"OK: docker_state={state_status} health={health_status} uptime={uptime}s")
+            return True
 
         # It's down
-        if down_since is None:
-            down_since = loop_t
-            log(f"caída detectada; grace {down_grace}s (docker_state={state_status}, health={health_status})")
-            try:
-                tail = api.container_logs_tail(vpn_container, tail=log_tail)
-                log(f"--- {vpn_container} logs tail({log_tail}) ---\n{tail}\n--- end tail ---")
-            except Exception as ex:
-                log(f"could not fetch {vpn_container} logs: {ex}")
+        if self.down_since is None:
+            self.down_since = loop_t
+            if self.detected_at is None:
+                self.detected_at = loop_t
+                # when did it actually go down: container exit time, or the last (failing) healthcheck
+                if state_status == "running":
+                    failed_ts = parse_docker_time(((health_summary.get("Last") or {}).get("End")))
+                else:
+                    failed_ts = parse_docker_time(state_finished_at)
+                if failed_ts is not None:
+                    METRICS.observe("vpn_watchdog_detect_seconds", max(0.0, loop_t - failed_ts),
+                                    group=cfg.name, kind="down")
+            self.log(f"caída detectada; grace {cfg.down_grace}s (docker_state={state_status}, health={health_status})")
+            self._log_tail()
 
-        elapsed = int(loop_t - down_since)
-        log(f"sigue caído (elapsed={elapsed}s, docker_state={state_status}, health={health_status})")
+        elapsed = int(loop_t - self.down_since)
+        self.log(f"sigue caído (elapsed={elapsed}s, docker_state={state_status}, health={health_status})")
 
-        if elapsed < down_grace:
-            time.sleep(check_interval)
-            continue
+        if elapsed < cfg.down_grace:
+            return False
 
-        if loop_t < next_action_after:
-            log(f"cooldown active: next_action_in={int(next_action_after - loop_t)}s")
-            time.sleep(check_interval)
-            continue
+        if loop_t < self.next_action_after:
+            self.log(f"cooldown active: next_action_in={int(self.next_action_after - loop_t)}s")
+            return False
 
         if not vpn_id:
-            log("VPN container no visible (sin ID) -> esperando")
-            time.sleep(check_interval)
-            continue
+            self.log("VPN container no visible (sin ID) -> esperando")
+            return False
 
-        targets = []
-        if restart_vpn:
-            targets.append(vpn_container)
-        targets.extend(dependents)
+        self.log(f">={cfg.down_grace}s => reiniciando por caída sostenida")
+        self._restart_targets(vpn_id)
+
+        self.next_action_after = self.clock() + cfg.cooldown
+        self.down_since = self.clock()
+        return False
+
+
+# -------------------------------
+# Main
+# -------------------------------
 
-        log(f">={down_grace}s => reiniciando por caída sostenida")
-        restart_or_recreate_targets(
-            api,
-            vpn_id=vpn_id,
-            vpn_container=vpn_container,
-            targets=targets,
-            restart_timeout_s=restart_timeout_s,
-            stop_timeout_s=stop_timeout_s,
-            recreate_on_netns_error=recreate_on_netns_error,
-            log_tail=log_tail,
-        )
 
-        next_action_after = time.time() + cooldown
-        down_since = time.time()
-        time.sleep(check_interval)
+def main() -> int:
+    config_path = getenv_str("WATCHDOG_CONFIG", "")
+    groups = load_groups(config_path or None)
+
+    check_interval = getenv_int("CHECK_INTERVAL", 10)
+
+    verbose = getenv_bool("VERBOSE", True)
+    print_health_logs = getenv_bool("PRINT_HEALTH_LOGS", True)
+    log_tail = getenv_int("PRINT_CONTAINER_LOG_TAIL", 60)
+    log_max_bytes = getenv_int("LOG_TAIL_MAX_BYTES", 65536)
+    log_follow_s = getenv_int("LOG_FOLLOW_S", 0)
+
+    action_workers = getenv_int("ACTION_WORKERS", 4)
+    state_file = getenv_str("STATE_FILE", "")
+    state_max_age = getenv_int("STATE_MAX_AGE", 300)
+    prestage = getenv_bool("PRESTAGE_RECREATE", True)
+    pull_images = getenv_bool("PREPULL_IMAGES", False)
+
+    docker_host = getenv_str("DOCKER_HOST", "unix:///var/run/docker.sock")
+    docker_timeout = getenv_int("DOCKER_TIMEOUT", 30)
+    api_retries = getenv_int("DOCKER_RETRIES", 3)
+    api_retry_sleep = float(getenv_str("DOCKER_RETRY_SLEEP", "1"))
+
+    events_mode = getenv_bool("EVENTS_MODE", True)
+    reconcile_interval = getenv_int("RECONCILE_INTERVAL", 60)
+
+    metrics_port = getenv_int("METRICS_PORT", 0)
+    metrics_bind = getenv_str("METRICS_BIND", "0.0.0.0")
+    metrics_textfile = getenv_str("METRICS_TEXTFILE", "")
+
+    api = DockerAPI(docker_host=docker_host, timeout=docker_timeout, retries=api_retries, retry_sleep=api_retry_sleep)
+
+    log("========================================================")
+    log("watchdog v4 (restart + netns-recreate) - starting")
+    log(f"DOCKER_HOST={docker_host} timeout={docker_timeout}s retries={api_retries}")
+    log(f"WATCHDOG_CONFIG={config_path or '(env)'} groups={len(groups)}")
+    for g in groups:
+        deps_desc = ";".join(k + ":" + ",".join(v) for k, v in g.depends_on.items())
+        log(f"[{g.name}] VPN_CONTAINER={g.vpn_container} DEPENDENTS={','.join(g.dependents) if g.dependents else '(none)'}")
+        log(f"[{g.name}] STARTUP_GRACE={g.startup_grace}s DOWN_GRACE={g.down_grace}s COOLDOWN={g.cooldown}s")
+        log(f"[{g.name}] RESTART_ON_VPN_RESTART={int(g.restart_on_vpn_restart)} VPN_RESTART_GRACE={g.vpn_restart_grace}s")
+        log(f"[{g.name}] RECREATE_ON_NETNS_MISMATCH={int(g.recreate_on_netns_mismatch)} RECREATE_ON_NETNS_ERROR={int(g.recreate_on_netns_error)}")
+        log(f"[{g.name}] STOP_TIMEOUT_S={g.stop_timeout_s} RESTART_TIMEOUT_S={g.restart_timeout_s} RESTART_VPN={int(g.restart_vpn)}")
+        log(f"[{g.name}] DEPENDS_ON={deps_desc or '(none)'}")
+    log(f"CHECK_INTERVAL={check_interval}s EVENTS_MODE={int(events_mode)} RECONCILE_INTERVAL={reconcile_interval}s")
+    log(f"PRESTAGE_RECREATE={int(prestage)} PREPULL_IMAGES={int(pull_images)}")
+    log(f"STATE_FILE={state_file or '(off)'} STATE_MAX_AGE={state_max_age}s")
+    log(f"ACTION_WORKERS={action_workers} VERBOSE={int(verbose)} PRINT_HEALTH_LOGS={int(print_health_logs)} LOG_TAIL={log_tail}")
+    log(f"LOG_TAIL_MAX_BYTES={log_max_bytes} LOG_FOLLOW_S={log_follow_s}s")
+    log(f"METRICS_PORT={metrics_port or '(off)'} METRICS_TEXTFILE={metrics_textfile or '(off)'}")
+    log("========================================================")
+
+    if metrics_port:
+        try:
+            start_metrics_server(metrics_bind, metrics_port)
+            log(f"metrics: sirviendo http://{metrics_bind}:{metrics_port}/metrics")
+        except OSError as e:
+            log(f"metrics: no se pudo abrir {metrics_bind}:{metrics_port}: {e}")
+
+    supervisors = [
+        VpnSupervisor(api, g, verbose=verbose, print_health_logs=print_health_logs, log_tail=log_tail,
+                      action_workers=action_workers, prefix_logs=len(groups) > 1, prestage=prestage,
+                      pull_images=pull_images, log_max_bytes=log_max_bytes, log_follow_s=log_follow_s)
+        for g in groups
+    ]
+
+    last_saved: str | None = None
+    last_saved_at = 0.0
+    if state_file:
+        saved = load_state(state_file)
+        saved_at = float(saved.get("saved_at") or 0)
+        now = time.time()
+        for sup in supervisors:
+            data = saved["groups"].get(sup.cfg.name)
+            if data is None:
+                continue
+            if sup.restore_state(data, saved_at, state_max_age, now):
+                sup.log(f"state: restaurado de hace {int(now - saved_at)}s; sin startup grace "
+                        f"(vpn_id={(sup.last_vpn_id or '-')[:12]}, cooldown={int(max(0, sup.next_action_after - now))}s)")
+            elif sup.next_action_after > now:
+                sup.log(f"state: checkpoint antiguo; solo se mantiene el cooldown ({int(sup.next_action_after - now)}s)")
+
+    watcher: EventWatcher | None = None
+    if events_mode:
+        watched = list(dict.fromkeys(n for g in groups for n in [g.vpn_container] + g.dependents))
+        watcher = EventWatcher(api, watched)
+    subs = {sup.cfg.name: watcher.subscribe([sup.cfg.vpn_container] + sup.cfg.dependents)
+            for sup in supervisors} if watcher is not None else {}
+    if watcher is not None:
+        watcher.start()
+
+    # what each group exported after its last finished tick; the state file is written from this
+    exported = {sup.cfg.name: sup.export_state() for sup in supervisors}
+    checkpoint_lock = threading.Lock()
+
+    def write_state(now: float) -> None:
+        """Rewrite STATE_FILE when something changed, and now and then so a healthy state stays "fresh" (hold the lock)."""
+        nonlocal last_saved, last_saved_at
+        blob = json.dumps(exported, sort_keys=True)
+        if blob != last_saved or now - last_saved_at >= state_max_age / 2:
+            try:
+                save_state(state_file, {"version": 1, "saved_at": now, "groups": dict(exported)})
+                last_saved = blob
+                last_saved_at = now
+            except OSError as e:
+                log(f"state: no se pudo escribir {state_file}: {e}")
+
+    def refresh_state() -> None:
+        # Healthy groups with a live event stream only tick every RECONCILE_INTERVAL, which can exceed
+        # STATE_MAX_AGE: keep the checkpoint fresh on its own timer.
+        while True:
+            time.sleep(max(1.0, state_max_age / 4))
+            with checkpoint_lock:
+                write_state(time.time())
+
+    def checkpoint(sup: VpnSupervisor) -> None:
+        """Publish one group's state after its tick: metrics, state file and textfile (serialized across groups)."""
+        now = time.time()
+        with checkpoint_lock:
+            sup.update_metrics(now)
+            exported[sup.cfg.name] = sup.export_state()
+            if state_file:
+                write_state(now)
+            if metrics_textfile:
+                try:
+                    METRICS.write_textfile(metrics_textfile)
+                except OSError as e:
+                    log(f"metrics: no se pudo escribir {metrics_textfile}: {e}")
+
+    def wait_next(sup: VpnSupervisor, idle: bool = False) -> None:
+        """Sleep until this group's next tick. With a live event stream an idle (healthy) group only reconciles slowly."""
+        if watcher is None:
+            time.sleep(check_interval)
+            return
+        timeout = reconcile_interval if (idle and watcher.connected.is_set()) else check_interval
+        evs = watcher.wait(subs[sup.cfg.name], timeout)
+        if evs and verbose:
+            sup.log("event: " + " ".join(describe_event(ev) for ev in evs))
+
+    def run_group(sup: VpnSupervisor) -> None:
+        while True:
+            try:
+                idle = sup.tick()
+            except Exception as e:
+                sup.log(f"tick error: {_brief(str(e), 300)}")
+                idle = False
+            checkpoint(sup)
+            wait_next(sup, idle)
+
+    if state_file:
+        threading.Thread(target=refresh_state, name="wd-state", daemon=True).start()
+
+    # One loop per group: a 30s stop/recreate in one group must not delay detection in another.
+    for sup in supervisors[1:]:
+        threading.Thread(target=run_group, args=(sup,), name=f"wd-{sup.cfg.name}", daemon=True).start()
+    run_group(supervisors[0])
 
 
 if __name__ == "__main__":